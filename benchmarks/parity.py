@@ -0,0 +1,415 @@
+"""
+Parity check of the two renderers: the same Document script runs on the server renderer (fpdf2) and on the client
+renderer (jspdf on top of fast_pdf.headless.HeadlessJsPDF), both outputs are reduced to positioned items and diffed
+  text runs: page, left edge and baseline of every drawn text (mm from the top left corner)
+  lines, rectangles and images: page and geometry
+Text runs are matched by their text -> different line breaks (multi_cell wrapping) show up as missing and extra runs,
+different page breaks as runs on another page. Both paths are timed, slower runs than a saved baseline fail the check
+
+The fpdf side is read back from the pdf with pypdf, the jspdf side from the recorded javascript calls
+The default position tolerance covers fpdf's cell margin: left aligned text starts 1 mm further right than on jspdf
+
+Usage (from the repository root):
+  python benchmarks/parity.py                         check all scripts
+  python benchmarks/parity.py --script wrapping -v    one script, list every difference
+  python benchmarks/parity.py --tolerance-mm 0.5      allowed position difference
+  python benchmarks/parity.py --save 1.2.0            store the timings as benchmarks/baselines/1.2.0.parity.json
+  python benchmarks/parity.py --compare 1.2.0         exit with 1 if a renderer got slower by more than --tolerance
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import run
+
+POINTS_PER_MM = 72 / 25.4
+
+
+def header(pdf):
+  pdf.set_font('helvetica','',9)
+  pdf.cell(100,5,'Parity check',ln=1)
+  pdf.line(10,16,200,16)
+
+
+def footer(pdf):
+  #fpdf calls the footer wherever the page content ended, jspdf below the content area
+  pdf.set_y(282)
+  pdf.set_font('helvetica','',8)
+  pdf.cell(100,5,f'Page {pdf.page_no()}',ln=1)
+
+
+def create_document(renderer,**page_setup):
+  '''header and footer callbacks work the same way on both renderers'''
+  return run.create_document(renderer,header_function=header,footer_function=footer,**page_setup)
+
+
+def script_cells(renderer,scale):
+  '''cells with all alignments, fills and font changes'''
+  doc = create_document(renderer)
+  doc.add_page()
+  for i in range(int(400 * scale)):
+    doc.set_font('helvetica',8 + i % 4,'B' if i % 5 == 0 else '')
+    doc.cell(20,6,str(i))
+    doc.cell(100,6,run.get_text(i,6),align='C')
+    doc.cell(50,6,f'{i * 2.5:.2f}',align='R',ln=1)
+  return [doc]
+
+
+def script_pagination(renderer,scale):
+  '''cells of different heights running over many automatic page breaks'''
+  doc = create_document(renderer)
+  doc.set_font('helvetica',10)
+  doc.add_page()
+  for i in range(int(1200 * scale)):
+    doc.cell(60,4 + i % 7,f'line {i}',ln=1)
+    if i % 97 == 96:
+      doc.spacer(30)
+  return [doc]
+
+
+def script_wrapping(renderer,scale):
+  '''paragraphs wrapped by multi_cell with both line breaking modes and alignments'''
+  doc = create_document(renderer)
+  doc.add_page()
+  for i in range(int(120 * scale)):
+    doc.set_font('helvetica',9 + i % 3)
+    doc.multi_cell(60 + i % 5 * 25,5,run.get_text(i,40 + i % 30),ln=1,align=('L','C','R')[i % 3],mode=('greedy','knuth_plass')[i % 2])
+  return [doc]
+
+
+def script_shapes(renderer,scale):
+  '''lines and rectangles in all styles'''
+  doc = create_document(renderer)
+  doc.set_font('helvetica',10)
+  for i in range(int(600 * scale)):
+    if i % 60 == 0:
+      doc.add_page()
+    x = 10 + i % 6 * 30
+    y = 30 + i % 60 // 6 * 25
+    doc.line(x,y,x + 25,y + 20)
+    doc.rect(x,y,25,20,('D','F','DF')[i % 3])
+  return [doc]
+
+
+def script_table(renderer,scale):
+  '''Document.table with wrapped cells and repeated header rows'''
+  doc = create_document(renderer)
+  doc.add_page()
+  doc.set_font('helvetica',9)
+  rows = ((i,run.get_text(i,4 + i % 12),f'{i * 1.5:.2f}') for i in range(int(1000 * scale)))
+  doc.table([{'title':'#','width':20},'Description',{'title':'Amount','width':40,'align':'R'}],rows,line_height=5)
+  return [doc]
+
+
+def script_images(renderer,scale):
+  '''images with and without keeping their aspect ratio'''
+  import io
+  import anvil
+  from PIL import Image
+  media = []
+  for i,size in enumerate([(400,300),(300,400),(200,200)]):
+    buffer = io.BytesIO()
+    Image.new('RGB',size,(i * 80,120,200 - i * 60)).save(buffer,'JPEG')
+    media.append(anvil.BlobMedia('image/jpeg',buffer.getvalue()))
+
+  doc = create_document(renderer)
+  doc.set_font('helvetica',9)
+  for i in range(int(120 * scale)):
+    if i % 6 == 0:
+      doc.add_page()
+    doc.add_image(media[i % len(media)],x=10 + (i % 2) * 95,y=25 + (i % 6) // 2 * 85,w=90,h=70,keep_aspect_ratio=i % 4 != 3)
+  return [doc]
+
+
+def script_bulk(renderer,scale):
+  '''charts drawn with the bulk primitives lines, rects and cells'''
+  import math
+  doc = create_document(renderer)
+  doc.set_font('helvetica',7)
+  for page in range(max(1,int(20 * scale))):
+    doc.add_page()
+    xs = [10 + i * 0.9 for i in range(200)]
+    ys = [120 + 40 * math.sin(x / 10 + page) for x in xs]
+    doc.lines([value for i in range(len(xs) - 1) for value in (xs[i],ys[i],xs[i + 1],ys[i + 1])])
+    doc.rects([(x,230 - y / 4,4,y / 4) for x,y in zip(xs[::10],ys[::10])],('F','DF')[page % 2])
+    doc.cells(xs[::10],[235] * 20,8,[f'{y:.1f}' for y in ys[::10]],align=('L','C','R')[page % 3],fill=page % 2 == 0)
+  return [doc]
+
+
+def draw_frame(pdf):
+  '''static header drawn with the bulk primitives'''
+  pdf.set_font('helvetica','',8)
+  pdf.lines([(10,12 + i * 2,200,12 + i * 2) for i in range(3)])
+  pdf.rects([(10 + i * 38,5,35,5) for i in range(5)],'D')
+  pdf.cells([10 + i * 38 for i in range(5)],[5] * 5,[35] * 5,[f'Column {i}' for i in range(5)],5,align='C')
+
+
+def script_static(renderer,scale):
+  '''static header with bulk lines, rects and cells replayed on every page'''
+  from fast_pdf import static
+  doc = run.create_document(renderer,header_function=static.StaticBlock(draw_frame),footer_function=footer)
+  doc.set_font('helvetica',10)
+  doc.add_page()
+  for i in range(int(600 * scale)):
+    doc.cell(60,6,f'line {i}',ln=1)
+  return [doc]
+
+
+SCRIPTS = {
+  'cells':script_cells,
+  'pagination':script_pagination,
+  'wrapping':script_wrapping,
+  'shapes':script_shapes,
+  'table':script_table,
+  'images':script_images,
+  'bulk':script_bulk,
+  'static':script_static,
+}
+
+
+def _transform(matrix,x,y):
+  return x * matrix[0] + y * matrix[2] + matrix[4],x * matrix[1] + y * matrix[3] + matrix[5]
+
+
+def get_fpdf_items(pdf_bytes):
+  '''returns the positioned items of a pdf created by fpdf2 in drawing order'''
+  import io
+  try:
+    import pypdf
+  except ImportError:
+    raise ImportError('the parity check reads the fpdf output with pypdf -> pip install pypdf')
+  reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+  items = []
+  for number,page in enumerate(reader.pages,1):
+    height = float(page.mediabox.height)
+    xobjects = page.get('/Resources',{}).get('/XObject',{})
+    path = []
+
+    def to_mm(matrix,x,y):
+      x,y = _transform(matrix,x,y)
+      return round(x / POINTS_PER_MM,3),round((height - y) / POINTS_PER_MM,3)
+
+    def visit_operand(operator,operands,cm,tm):
+      if operator == b'm':
+        path[:] = [to_mm(cm,*operands)]
+      elif operator == b'l' and path:
+        path.append(to_mm(cm,*operands))
+        if len(path) == 2:
+          items.append({'kind':'line','page':number,'points':path[0] + path[1]})
+      elif operator == b're':
+        x,y,w,h = operands
+        (x1,y1),(x2,y2) = to_mm(cm,x,y),to_mm(cm,x + w,y + h)
+        items.append({'kind':'rect','page':number,'points':(min(x1,x2),min(y1,y2),round(abs(x2 - x1),3),round(abs(y2 - y1),3))})
+      elif operator == b'Do':
+        xobject = xobjects.get(operands[0])
+        if xobject is not None and xobject.get_object().get('/Subtype') == '/Image':
+          left,top = to_mm(cm,0,1)
+          items.append({'kind':'image','page':number,'points':(left,top,round(cm[0] / POINTS_PER_MM,3),round(cm[3] / POINTS_PER_MM,3))})
+
+    def visit_text(text,cm,tm,font,size):
+      text = text.strip()
+      if text:
+        x,y = to_mm(cm,tm[4],tm[5])
+        items.append({'kind':'text','page':number,'points':(x,y),'text':text})
+
+    page.extract_text(visitor_operand_before=visit_operand,visitor_text=visit_text)
+  return items
+
+
+def get_jspdf_items(calls):
+  '''returns the positioned items of the calls recorded by a HeadlessJsPDF in drawing order'''
+  from fast_pdf import headless
+  items = []
+  page = 1
+  font = ['helvetica','',16]
+  for call in calls:
+    method,args = call[0],call[1:]
+    if method == 'addPage':
+      page += 1
+    elif method == 'setFont':
+      font[0:2] = [args[0],headless._get_style_suffix(args[1] if len(args) > 1 else '')]
+    elif method == 'setFontSize':
+      font[2] = args[0]
+    elif method == 'text':
+      text,x,y = args[0],args[1],args[2]
+      options = args[3] if len(args) > 3 else {}
+      align = options.get('align','left') if isinstance(options,dict) else 'left'
+      if align != 'left':
+        #jspdf aligns at x, left edge from the width of the whole string
+        widths = headless.get_core_font_widths(font[0],font[1])
+        width = sum(widths.get(char,500) for char in text) if widths else len(text) * 500
+        x -= width / 1000 * font[2] / POINTS_PER_MM / (2 if align == 'center' else 1)
+      if text.strip():
+        items.append({'kind':'text','page':page,'points':(round(x,3),round(y,3)),'text':text.strip()})
+    elif method == 'line':
+      items.append({'kind':'line','page':page,'points':tuple(args[:4])})
+    elif method == 'rect':
+      x,y,w,h = args[:4]
+      items.append({'kind':'rect','page':page,'points':(x,min(y,y + h),abs(w),abs(h))})
+    elif method == 'addImage':
+      items.append({'kind':'image','page':page,'points':tuple(args[2:6])})
+  return items
+
+
+def _get_distance(item,other):
+  return max(abs(a - b) for a,b in zip(item['points'],other['points']))
+
+
+def _get_reading_order(item):
+  #jspdf draws the footer when the next page starts, fpdf when the page ends -> compare in reading order
+  return item['page'],round(item['points'][1],1),item['points'][0]
+
+
+def _match_texts(fpdf_texts,jspdf_texts):
+  '''yields (fpdf item,jspdf item) of the aligned text sequences, None for runs only one renderer drew'''
+  from difflib import SequenceMatcher
+  matcher = SequenceMatcher(None,[item['text'] for item in fpdf_texts],[item['text'] for item in jspdf_texts],autojunk=False)
+  for tag,start,end,other_start,other_end in matcher.get_opcodes():
+    if tag == 'equal':
+      yield from zip(fpdf_texts[start:end],jspdf_texts[other_start:other_end])
+      continue
+    for item in fpdf_texts[start:end]:
+      yield item,None
+    for item in jspdf_texts[other_start:other_end]:
+      yield None,item
+
+
+def _match_shapes(fpdf_shapes,jspdf_shapes):
+  '''yields (fpdf item,jspdf item) pairs of the closest shapes of the same kind on the same page'''
+  from collections import defaultdict
+  candidates = defaultdict(list)
+  for item in jspdf_shapes:
+    candidates[(item['kind'],item['page'])].append(item)
+  for item in fpdf_shapes:
+    others = candidates[(item['kind'],item['page'])]
+    other = min(others,key=lambda other: _get_distance(item,other)) if others else None
+    if other is not None:
+      others.remove(other)
+    yield item,other
+  for others in candidates.values():
+    for other in others:
+      yield None,other
+
+
+def compare_items(fpdf_items,jspdf_items,tolerance):
+  '''
+  returns (differences,max_distance)
+  text runs are aligned as sequences in reading order, shapes matched with the closest one on the same page
+  '''
+  fpdf_texts = sorted((item for item in fpdf_items if item['kind'] == 'text'),key=_get_reading_order)
+  jspdf_texts = sorted((item for item in jspdf_items if item['kind'] == 'text'),key=_get_reading_order)
+  pairs = list(_match_texts(fpdf_texts,jspdf_texts))
+  pairs.extend(_match_shapes([item for item in fpdf_items if item['kind'] != 'text'],[item for item in jspdf_items if item['kind'] != 'text']))
+
+  differences = []
+  max_distance = 0
+  for item,other in pairs:
+    if other is None:
+      differences.append(f"only on fpdf: {_describe(item)}")
+    elif item is None:
+      differences.append(f"only on jspdf: {_describe(other)}")
+    elif other['page'] != item['page']:
+      differences.append(f"page {item['page']} on fpdf, {other['page']} on jspdf: {_describe(item)}")
+    else:
+      distance = _get_distance(item,other)
+      max_distance = max(max_distance,distance)
+      if distance > tolerance:
+        differences.append(f"moved by {distance:.2f} mm: {_describe(item)} -> {other['points']}")
+  return differences,max_distance
+
+
+def _describe(item):
+  text = f" {item['text'][:40]!r}" if item['kind'] == 'text' else ''
+  return f"{item['kind']} page {item['page']} at {item['points']}{text}"
+
+
+def render(name,renderer,scale,repeat):
+  '''returns (items of all documents,fastest seconds of repeat runs)'''
+  seconds = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    documents = SCRIPTS[name](renderer,scale)
+    if renderer == 'fpdf':
+      outputs = [bytes(doc._get_output()) for doc in documents]
+    else:
+      for doc in documents:
+        doc.doc.flush()
+      outputs = [doc.doc.doc.calls for doc in documents]
+    elapsed = time.perf_counter() - start
+    seconds = elapsed if seconds is None else min(seconds,elapsed)
+
+  items = []
+  for index,output in enumerate(outputs):
+    document_items = get_fpdf_items(output) if renderer == 'fpdf' else get_jspdf_items(output)
+    for item in document_items:
+      item['page'] = (index,item['page'])
+    items.extend(document_items)
+  return items,seconds
+
+
+def check(name,scale,tolerance,repeat,verbose):
+  fpdf_items,fpdf_seconds = render(name,'fpdf',scale,repeat)
+  jspdf_items,jspdf_seconds = render(name,'jspdf',scale,repeat)
+  differences,max_distance = compare_items(fpdf_items,jspdf_items,tolerance)
+  pages = [len({item['page'] for item in items}) for items in (fpdf_items,jspdf_items)]
+  status = 'ok' if not differences else f'{len(differences)} differences'
+  print(f"{name:<12}{pages[0]:>5}/{pages[1]:<5} pages{len(fpdf_items):>7} items  max {max_distance:>6.2f} mm"
+        f"  fpdf {fpdf_seconds:>7.3f}s  jspdf {jspdf_seconds:>7.3f}s  {status}")
+  for difference in differences if verbose else differences[:5]:
+    print(f'    {difference}')
+  if len(differences) > 5 and not verbose:
+    print(f'    ... {len(differences) - 5} more, use --verbose')
+  return {'script':name,'differences':len(differences),'max_distance_mm':max_distance,
+          'seconds':{'fpdf':round(fpdf_seconds,4),'jspdf':round(jspdf_seconds,4)}}
+
+
+def compare_timings(results,baseline_name,tolerance):
+  '''returns the list of (script,renderer) that got slower than the baseline by more than tolerance'''
+  with open(os.path.join(run.BASELINES,f'{baseline_name}.parity.json')) as file:
+    baseline = {item['script']:item for item in json.load(file)['results']}
+  regressions = []
+  for result in results:
+    previous = baseline.get(result['script'])
+    if not previous:
+      continue
+    for renderer,seconds in result['seconds'].items():
+      change = seconds / previous['seconds'][renderer] - 1 if previous['seconds'][renderer] else 0
+      print(f"{result['script']:<12}{renderer:<7}{change:>+9.1%} time")
+      if change > tolerance:
+        regressions.append((result['script'],renderer))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='fast_pdf renderer parity check')
+  parser.add_argument('--script',action='append',choices=sorted(SCRIPTS),help='check only this script (repeatable)')
+  parser.add_argument('--scale',type=float,default=0.1,help='multiplier for the workload size')
+  parser.add_argument('--tolerance-mm',type=float,default=1.5,help='allowed position difference in mm')
+  parser.add_argument('--repeat',type=int,default=3,help='timed runs per renderer, the fastest one counts')
+  parser.add_argument('--save',metavar='NAME',help='store timings as baseline NAME')
+  parser.add_argument('--compare',metavar='NAME',help='compare timings with baseline NAME')
+  parser.add_argument('--tolerance',type=float,default=0.2,help='allowed slowdown when comparing (0.2 = 20%%)')
+  parser.add_argument('-v','--verbose',action='store_true',help='list every difference')
+  args = parser.parse_args()
+
+  sys.path.insert(0,os.path.join(run.ROOT,'client_code'))
+  import warnings
+  warnings.simplefilter('ignore')
+  results = [check(name,args.scale,args.tolerance_mm,args.repeat,args.verbose) for name in args.script or list(SCRIPTS)]
+
+  if args.save:
+    os.makedirs(run.BASELINES,exist_ok=True)
+    with open(os.path.join(run.BASELINES,f'{args.save}.parity.json'),'w') as file:
+      json.dump({'scale':args.scale,'python':sys.version.split()[0],'results':results},file,indent=2)
+  failed = any(result['differences'] for result in results)
+  if args.compare and compare_timings(results,args.compare,args.tolerance):
+    failed = True
+  if failed:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,369 @@
+"""
+Benchmarks for the Document api on both renderers
+  fpdf:  server renderer, runs headless with fpdf2 and anvil-uplink installed
+  jspdf: client renderer on top of fast_pdf.headless.HeadlessJsPDF, counts python -> javascript bridge calls
+
+Every scenario runs in a fresh process so the peak RSS belongs to that scenario only
+
+Usage (from the repository root):
+  python benchmarks/run.py                          run all scenarios
+  python benchmarks/run.py --scale 0.1              smaller workloads for a quick check
+  python benchmarks/run.py --save 1.2.0             store the results as benchmarks/baselines/1.2.0.json
+  python benchmarks/run.py --compare 1.2.0          exit with 1 if pages/sec dropped by more than --tolerance
+  python benchmarks/run.py --import-budget 150      exit with 1 if importing fast_pdf takes longer (ms)
+  python benchmarks/run.py --threads 1,2,4          concurrency stress test of the server renderer with a DocumentPool
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT,'benchmarks','baselines')
+FONT_PATHS = ['/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf','/Library/Fonts/Arial Unicode.ttf','C:/Windows/Fonts/arial.ttf']
+
+WORDS = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore'.split()
+
+
+def header(pdf):
+  pdf.set_font('helvetica','',9)
+  pdf.cell(100,5,'Benchmark report')
+  pdf.line(10,16,200,16)
+
+
+def footer(pdf):
+  pdf.set_font('helvetica','',8)
+  pdf.cell(100,5,f'Page {pdf.page_no()}')
+
+
+def create_document(renderer,**page_setup):
+  page_setup.setdefault('header_function',header)
+  page_setup.setdefault('footer_function',footer)
+  page_setup.setdefault('margin_top',20)
+  page_setup.setdefault('footer_height',5)
+  if renderer == 'jspdf':
+    from fast_pdf import headless
+    return headless.create_document(**page_setup)
+  from fast_pdf import Document
+  return Document(**page_setup)
+
+
+def get_text(index,words):
+  return ' '.join(WORDS[(index + i) % len(WORDS)] for i in range(words))
+
+
+def scenario_table_cells(renderer,scale):
+  '''10k table lines drawn with plain cell calls'''
+  doc = create_document(renderer)
+  doc.add_page()
+  doc.set_font('helvetica',9)
+  for i in range(int(10000 * scale)):
+    doc.cell(20,5,str(i))
+    doc.cell(120,5,get_text(i,8))
+    doc.cell(40,5,f'{i * 1.5:.2f}',align='R',ln=1)
+  return [doc]
+
+
+def scenario_table_api(renderer,scale):
+  '''10k table lines drawn with Document.table'''
+  doc = create_document(renderer)
+  doc.add_page()
+  doc.set_font('helvetica',9)
+  rows = ((i,get_text(i,8),f'{i * 1.5:.2f}') for i in range(int(10000 * scale)))
+  doc.table([{'title':'#','width':20},'Description',{'title':'Amount','width':40,'align':'R'}],rows,line_height=5)
+  return [doc]
+
+
+def scenario_paragraphs(renderer,scale):
+  '''long wrapped paragraphs'''
+  doc = create_document(renderer)
+  doc.add_page()
+  doc.set_font('helvetica',10)
+  for i in range(int(200 * scale)):
+    doc.multi_cell(180,5,get_text(i,250),ln=1)
+  return [doc]
+
+
+def scenario_images(renderer,scale):
+  '''image catalog: 20 distinct images repeated over the pages'''
+  import io
+  import anvil
+  from PIL import Image
+  media = []
+  for i in range(20):
+    buffer = io.BytesIO()
+    Image.new('RGB',(400,300),((i * 37) % 255,(i * 91) % 255,(i * 53) % 255)).save(buffer,'JPEG')
+    media.append(anvil.BlobMedia('image/jpeg',buffer.getvalue()))
+
+  doc = create_document(renderer)
+  doc.set_font('helvetica',9)
+  for i in range(int(600 * scale)):
+    if i % 6 == 0:
+      doc.add_page()
+    doc.add_image(media[i % len(media)],x=10 + (i % 2) * 95,y=25 + (i % 6) // 2 * 85,w=90,h=70)
+  return [doc]
+
+
+def scenario_header_footer(renderer,scale):
+  '''many pages with header and footer callbacks'''
+  doc = create_document(renderer)
+  doc.set_font('helvetica',10)
+  for i in range(int(300 * scale)):
+    doc.add_page()
+    doc.cell(100,10,f'Section {i}',ln=1)
+  return [doc]
+
+
+def scenario_fonts(renderer,scale):
+  '''many small documents with a custom ttf font'''
+  font_path = next((path for path in FONT_PATHS if os.path.exists(path)),None)
+  if font_path is None:
+    return []
+  from fast_pdf import fonts
+  fonts.registry.register_path('benchmark.ttf',font_path)
+  base_64_font = None
+  if renderer == 'jspdf':
+    import base64
+    with open(font_path,'rb') as file:
+      base_64_font = base64.b64encode(file.read()).decode('utf-8')
+
+  documents = []
+  for i in range(max(1,int(50 * scale))):
+    doc = create_document(renderer,header_function=None,footer_function=None)
+    doc.add_font('benchmark.ttf','benchmark',base_64_font)
+    doc.set_font('benchmark',11)
+    doc.add_page()
+    doc.multi_cell(180,5,get_text(i,60),ln=1)
+    documents.append(doc)
+  return documents
+
+
+def scenario_chart(renderer,scale):
+  '''chart pages drawn with the bulk primitives lines, rects and cells'''
+  import math
+  doc = create_document(renderer)
+  doc.set_font('helvetica',7)
+  for page in range(int(100 * scale)):
+    doc.add_page()
+    xs = [10 + i * 0.18 for i in range(1000)]
+    ys = [140 + 60 * math.sin(x / 7 + page) for x in xs]
+    doc.lines([value for i in range(len(xs) - 1) for value in (xs[i],ys[i],xs[i + 1],ys[i + 1])])
+    doc.lines([value for i in range(20) for value in (10,30 + i * 12,190,30 + i * 12)])
+    doc.rects([(x,260 - y / 5,0.8,y / 5) for x,y in zip(xs[::5],ys[::5])],'F')
+    doc.cells(xs[::50],[262] * 20,9,[f'{y:.1f}' for y in ys[::50]],align='C')
+  return [doc]
+
+
+SCENARIOS = {
+  'table_cells':scenario_table_cells,
+  'table_api':scenario_table_api,
+  'paragraphs':scenario_paragraphs,
+  'images':scenario_images,
+  'header_footer':scenario_header_footer,
+  'fonts':scenario_fonts,
+  'chart':scenario_chart,
+}
+
+
+def get_stress_images():
+  '''large noisy images -> downsampling and jpeg encoding dominate, PIL releases the GIL for both'''
+  import io
+  import random
+  import anvil
+  from PIL import Image
+  media = []
+  for i in range(4):
+    noise = random.Random(i).randbytes(1200 * 900 * 3)
+    buffer = io.BytesIO()
+    Image.frombytes('RGB',(1200,900),noise).save(buffer,'PNG')
+    media.append(anvil.BlobMedia('image/png',buffer.getvalue()))
+  return media
+
+
+def stress_job(doc,index,images):
+  '''one document per job: a compressed text page and two images downsampled to their drawn size'''
+  doc.add_page()
+  doc.set_font('helvetica',8)
+  doc.multi_cell(190,3.5,get_text(index,2500),ln=1)
+  for i in range(2):
+    doc.add_image(images[(index + i) % len(images)],x=10 + i * 95,y=200,w=90,h=68)
+
+
+def run_stress(threads,jobs,queue):
+  '''runs in a separate process -> renders jobs documents with a thread pool sharing one DocumentPool'''
+  sys.path.insert(0,os.path.join(ROOT,'client_code'))
+  import warnings
+  warnings.simplefilter('ignore')
+  from concurrent.futures import ThreadPoolExecutor
+  from fast_pdf.optimize import OutputProfile
+  from fast_pdf.pool import DocumentPool
+  images = get_stress_images()
+  #default compression level -> profiles with their own level serialize their outputs
+  pool = DocumentPool({'output_profile':OutputProfile(image_dpi=200,image_quality=80)})
+  #warm up the registries like a long running server process
+  pool.render(stress_job,0,images)
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=threads) as executor:
+    sizes = list(executor.map(lambda index: len(pool.render(stress_job,index,images)),range(jobs)))
+  seconds = time.perf_counter() - start
+  queue.put({'threads':threads,'jobs':jobs,'seconds':round(seconds,4),'documents_per_second':round(jobs / seconds,2),'sizes':sizes,'pool':pool.get_stats()})
+
+
+def run_threads(thread_counts,scale):
+  '''returns False if documents rendered concurrently differ from the ones rendered by a single thread'''
+  context = multiprocessing.get_context('spawn')
+  jobs = max(4,int(80 * scale))
+  results = []
+  for threads in thread_counts:
+    queue = context.Queue()
+    process = context.Process(target=run_stress,args=(threads,jobs,queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    results.append(result)
+    speedup = result['documents_per_second'] / results[0]['documents_per_second']
+    print(f"{'threads':<15}{threads:>3}{jobs:>8} docs{result['seconds']:>10.2f}s{result['documents_per_second']:>10.1f} docs/s{speedup:>7.2f}x  pool {result['pool']}")
+  #output sizes only depend on the job -> any difference means state leaked between threads
+  consistent = all(result['sizes'] == results[0]['sizes'] for result in results)
+  if not consistent:
+    print('documents rendered with several threads differ from the single thread ones')
+  return consistent
+
+
+def run_scenario(name,renderer,scale,queue):
+  '''runs in a separate process and puts the result dict into queue'''
+  sys.path.insert(0,os.path.join(ROOT,'client_code'))
+  import resource
+  import warnings
+  warnings.simplefilter('ignore')
+
+  start = time.perf_counter()
+  documents = SCENARIOS[name](renderer,scale)
+  pages = sum(doc.page_no() for doc in documents)
+  output_size = 0
+  bridge_calls = 0
+  for doc in documents:
+    if renderer == 'jspdf':
+      doc.doc.flush()
+      bridge_calls += doc.doc.doc.bridge_calls
+    else:
+      output_size += len(doc.to_blob().get_bytes())
+  seconds = time.perf_counter() - start
+
+  queue.put({
+    'scenario':name,
+    'renderer':renderer,
+    'pages':pages,
+    'seconds':round(seconds,4),
+    'pages_per_second':round(pages / seconds,2) if seconds and pages else 0,
+    #linux reports kilobytes
+    'peak_rss_mb':round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,1),
+    'output_bytes':output_size if renderer == 'fpdf' else None,
+    'bridge_calls':bridge_calls if renderer == 'jspdf' else None,
+  })
+
+
+def measure_import(queue):
+  '''runs in a separate process -> cold import of fast_pdf and creation of a Document without drawing'''
+  sys.path.insert(0,os.path.join(ROOT,'client_code'))
+  import warnings
+  warnings.simplefilter('ignore')
+  #anvil itself is not part of the budget
+  import anvil
+  start = time.perf_counter()
+  import fast_pdf
+  imported = time.perf_counter()
+  fast_pdf.Document()
+  created = time.perf_counter()
+  queue.put({
+    'import_ms':round((imported - start) * 1000,1),
+    'document_ms':round((created - imported) * 1000,1),
+    'loaded':[name for name in ('fpdf','PIL','fontTools','pypdf') if name in sys.modules],
+  })
+
+
+def run_import(budget):
+  '''returns False if the import took longer than budget milliseconds'''
+  queue = multiprocessing.get_context('spawn').Queue()
+  process = multiprocessing.get_context('spawn').Process(target=measure_import,args=(queue,))
+  process.start()
+  result = queue.get()
+  process.join()
+  print(f"{'import':<22}{result['import_ms']:>10.1f} ms  Document(){result['document_ms']:>8.1f} ms  loaded: {', '.join(result['loaded']) or '-'}")
+  return budget is None or result['import_ms'] <= budget
+
+
+def run(scenarios,renderers,scale):
+  context = multiprocessing.get_context('spawn')
+  results = []
+  for name in scenarios:
+    for renderer in renderers:
+      queue = context.Queue()
+      process = context.Process(target=run_scenario,args=(name,renderer,scale,queue))
+      process.start()
+      result = queue.get()
+      process.join()
+      results.append(result)
+      print_result(result)
+  return results
+
+
+def print_result(result):
+  extra = f"{result['output_bytes']:>10} bytes" if result['renderer'] == 'fpdf' else f"{result['bridge_calls']:>10} calls"
+  print(f"{result['scenario']:<15}{result['renderer']:<7}{result['pages']:>7} pages{result['seconds']:>10.2f}s"
+        f"{result['pages_per_second']:>10.1f} pages/s{result['peak_rss_mb']:>9.1f} MB {extra}")
+
+
+def compare(results,baseline_name,tolerance):
+  '''returns the list of regressions against a stored baseline'''
+  with open(os.path.join(BASELINES,f'{baseline_name}.json')) as file:
+    baseline = {(item['scenario'],item['renderer']):item for item in json.load(file)['results']}
+  regressions = []
+  for result in results:
+    previous = baseline.get((result['scenario'],result['renderer']))
+    if not previous or not previous['pages_per_second']:
+      continue
+    change = result['pages_per_second'] / previous['pages_per_second'] - 1
+    print(f"{result['scenario']:<15}{result['renderer']:<7}{change:>+9.1%} pages/s")
+    if change < -tolerance:
+      regressions.append(result)
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='fast_pdf benchmarks')
+  parser.add_argument('--scenario',action='append',choices=sorted(SCENARIOS),help='run only this scenario (repeatable)')
+  parser.add_argument('--renderer',action='append',choices=['fpdf','jspdf'],help='run only this renderer (repeatable)')
+  parser.add_argument('--scale',type=float,default=1.0,help='multiplier for the workload size')
+  parser.add_argument('--save',metavar='NAME',help='store results as baseline NAME')
+  parser.add_argument('--compare',metavar='NAME',help='compare results with baseline NAME')
+  parser.add_argument('--tolerance',type=float,default=0.2,help='allowed pages/sec drop when comparing (0.2 = 20%%)')
+  parser.add_argument('--import-budget',type=float,metavar='MS',help='maximum import time of fast_pdf in milliseconds')
+  parser.add_argument('--threads',metavar='COUNTS',help='only run the concurrency stress test with these thread counts e.g. 1,2,4')
+  args = parser.parse_args()
+
+  if args.threads:
+    if not run_threads([int(count) for count in args.threads.split(',')],args.scale):
+      sys.exit(1)
+    return
+
+  import_ok = run_import(args.import_budget)
+  results = run(args.scenario or list(SCENARIOS),args.renderer or ['fpdf','jspdf'],args.scale)
+
+  if args.save:
+    os.makedirs(BASELINES,exist_ok=True)
+    with open(os.path.join(BASELINES,f'{args.save}.json'),'w') as file:
+      json.dump({'scale':args.scale,'python':sys.version.split()[0],'results':results},file,indent=2)
+  if args.compare and compare(results,args.compare,args.tolerance):
+    sys.exit(1)
+  if not import_ok:
+    print(f'import of fast_pdf exceeded the budget of {args.import_budget} ms')
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,133 @@
+"""
+Check of the page range streaming (fast_pdf.stream.PageChunker behind Document.stream_pages) on the headless client
+renderer: a 14 page document is streamed in ranges of 3 pages and every range is compared with the full document
+  ranges: first and last page of every range sent to on_pages
+  items: positioned text runs, lines, rectangles and images of all ranges (parity.get_jspdf_items) shifted to their page
+  state: font, font size and text color in effect for every drawn text
+  static header: the lines of the bulk drawn static header (parity.draw_frame) on every page
+Streaming starts once before the first page is drawn and once after all pages are drawn -> both paths of the chunker
+
+Usage (from the repository root):
+  python benchmarks/stream_check.py                   exit with 1 if a range differs from the full document
+  python benchmarks/stream_check.py -v                list every difference
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import parity
+import run
+
+PAGES = 14
+CHUNK_PAGES = 3
+EXPECTED_RANGES = [(1,3),(4,6),(7,9),(10,12),(13,14)]
+#lines drawn by parity.draw_frame
+FRAME_LINES = 3
+#operations whose last value applies to the following text
+STATE_OPS = ('setFont','setFontSize','setTextColor')
+
+
+def draw(doc):
+  '''font and color changes on every page -> each range has to start with the state left by the one before'''
+  for page in range(PAGES):
+    doc.add_page()
+    for i in range(20):
+      line = page * 20 + i
+      doc.set_font('helvetica',8 + line % 5,'B' if line % 11 == 0 else '')
+      if line % 7 == 0:
+        doc.set_text_color(200,0,0)
+      elif line % 7 == 3:
+        doc.set_text_color(0)
+      doc.cell(60,6,f'line {line}',ln=1)
+
+
+def get_states(calls,first_page):
+  '''(page,text,state) of every drawn text'''
+  state = {}
+  page = first_page
+  states = []
+  for call in calls:
+    method = call[0]
+    if method == 'addPage':
+      page += 1
+    elif method in STATE_OPS:
+      state[method] = tuple(str(arg) for arg in call[1:])
+    elif method == 'text':
+      states.append((page,call[1],tuple(sorted(state.items()))))
+  return states
+
+
+def get_item_key(item):
+  return (item['page'],item['kind'],item['points'],item.get('text',''))
+
+
+def check(early,verbose):
+  '''streams the document, returns the list of differences'''
+  from fast_pdf import headless,static
+  doc = headless.create_document(worker=True,header_function=static.StaticBlock(parity.draw_frame),footer_function=parity.footer,margin_top=20)
+  ranges = []
+  on_pages = lambda first_page,last_page,media: ranges.append((first_page,last_page,json.loads(media.get_bytes())))
+  if early:
+    doc.stream_pages(on_pages,chunk_pages=CHUNK_PAGES)
+  draw(doc)
+  if not early:
+    doc.stream_pages(on_pages,chunk_pages=CHUNK_PAGES)
+  doc.end_stream()
+  full = doc.doc.get_worker_job()['ops']
+
+  differences = []
+  got_ranges = [(first_page,last_page) for first_page,last_page,calls in ranges]
+  if got_ranges != EXPECTED_RANGES:
+    differences.append(f'ranges {got_ranges}, expected {EXPECTED_RANGES}')
+
+  items = []
+  states = []
+  for first_page,last_page,calls in ranges:
+    for item in parity.get_jspdf_items(calls):
+      item['page'] += first_page - 1
+      items.append(item)
+    states += get_states(calls,first_page)
+  full_items = sorted(map(get_item_key,parity.get_jspdf_items(full)))
+  range_items = sorted(map(get_item_key,items))
+  if full_items != range_items:
+    missing = [item for item in full_items if item not in range_items]
+    extra = [item for item in range_items if item not in full_items]
+    differences.append(f'items: {len(missing)} missing, {len(extra)} extra')
+    if verbose:
+      differences += [f'  missing {item}' for item in missing] + [f'  extra {item}' for item in extra]
+  lines = [sum(1 for item in items if item['kind'] == 'line' and item['page'] == page) for page in range(1,PAGES + 1)]
+  if lines != [FRAME_LINES] * PAGES:
+    differences.append(f'static header lines per page {lines}, expected {FRAME_LINES}')
+  full_states = get_states(full,1)
+  if full_states != states:
+    changed = [(expected,got) for expected,got in zip(full_states,states) if expected != got]
+    differences.append(f'state: {len(changed)} texts drawn with another state, {len(full_states)} texts expected, got {len(states)}')
+    if verbose:
+      differences += [f'  expected {expected}, got {got}' for expected,got in changed]
+  return differences
+
+
+def main():
+  parser = argparse.ArgumentParser(description='fast_pdf page range streaming check')
+  parser.add_argument('-v','--verbose',action='store_true',help='list every difference')
+  args = parser.parse_args()
+
+  sys.path.insert(0,os.path.join(run.ROOT,'client_code'))
+  import warnings
+  warnings.simplefilter('ignore')
+  failed = False
+  for early in (True,False):
+    differences = check(early,args.verbose)
+    name = 'before drawing' if early else 'after drawing'
+    print(f"{name:<16}{'ok' if not differences else 'FAILED'}")
+    for difference in differences:
+      print(f'  {difference}')
+    failed = failed or bool(differences)
+  if failed:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -1,3 +1,9 @@
 """
 Fast PDF 
+
+Server requirements, add them to the server environment of the app using this library:
+  fpdf2: server side rendering, static blocks become form xobjects with fpdf2 2.8.9 only
+         (other versions draw them again on every page and print a warning once)
+  pypdf: optional, needed by open_existing, OutputProfile(object_streams=True), get_size_report,
+         render_parallel and write_sections
 """
@@ -10,16 +10,52 @@ import anvil.js
 
 class preview(previewTemplate):
   def __init__(self, **properties):
+    #(first_page,last_page,media) of page ranges streamed by Document.stream_pages()
+    self.page_ranges = []
+    self.range_urls = []
+    self.shown = False
     self.init_components(**properties)
 
   
   def form_show(self, **event_args):
+    self.shown = True
     self.update_ui()
 
+  def form_hide(self, **event_args):
+    self.shown = False
+    self.revoke_url()
+
+  def add_pages(self,first_page,last_page,media):
+    '''shows a rendered page range below the pdf, ranges are kept in page order whenever they arrive'''
+    self.page_ranges.append((first_page,last_page,media))
+    if self.shown:
+      self.show_range(first_page,media)
+
+  def show_range(self,first_page,media):
+    import anvil.media
+    temp_url = anvil.media.TempUrl(media)
+    self.range_urls.append(temp_url)
+    self.call_js('append_url',temp_url.url,first_page)
+
   def update_ui(self):
+    self.revoke_url()
     if self.pdf_media:
-      from ...fast_pdf import utils
-      self.call_js('display_blob', utils.media_obj_to_base64(self.pdf_media))
+      #object url of the media -> the pdf is not copied into a base64 string
+      import anvil.media
+      self.temp_url = anvil.media.TempUrl(self.pdf_media)
+      self.call_js('display_url',self.temp_url.url)
     elif self.url:
       self.call_js('display_url',self.url)
+    if self.page_ranges:
+      self.call_js('clear_ranges')
+      for first_page,last_page,media in self.page_ranges:
+        self.show_range(first_page,media)
+
+  def revoke_url(self):
+    if getattr(self,'temp_url',None) is not None:
+      self.temp_url.revoke()
+      self.temp_url = None
+    for temp_url in self.range_urls:
+      temp_url.revoke()
+    self.range_urls = []
 
@@ -9,15 +9,13 @@ The goal is to create pdfs client and server side without round trips and a unif
 Subtle differences between server and client side implementation/results are possible!
 """
 
-import anvil.server
-import anvil.js
-import anvil.media
+import anvil
 
 from . import utils
 
 
 class Document:
-  def __init__(self,page_height=297,page_width=210,margin_top=10,margin_bottom=10,margin_left=10,margin_right=10,header_height=0,footer_height=0,header_function=None,footer_function=None,orientation='P'):
+  def __init__(self,page_height=297,page_width=210,margin_top=10,margin_bottom=10,margin_left=10,margin_right=10,header_height=0,footer_height=0,header_function=None,footer_function=None,orientation='P',batch_ops=False,worker=False,js_doc=None,profile=False,output_profile=None,cache=None):
     #Initial Variables that define the basic page layout
     self.page_height = page_height
     self.page_width = page_width
@@ -32,35 +30,123 @@ class Document:
     self.footer_function = footer_function
 
     self.orientation = orientation
+    #Client only: record draw operations and replay them into jspdf once per page
+    self.batch_ops = batch_ops
+    #Client only: record the whole document and render it in a web worker with to_blob_async
+    self.worker = worker
     self.server_side = anvil.is_server_side()
+    #jspdf compatible object -> forces the jspdf renderer e.g. headless.HeadlessJsPDF outside of the browser
+    self.js_doc = js_doc
+    #optimize.OutputProfile with compression and image settings, None keeps the renderer defaults
+    self.output_profile = output_profile
     
-    #Set Base Renderer
-    self.renderer_type = self._set_renderer(anvil.is_server_side())
+    #Base Renderer, created on first use -> documents that are only configured stay cheap
+    self.renderer_type = 'jspdf' if not self.server_side or self.js_doc is not None else 'fpdf'
+    self._doc = None
+    self._proxy_doc = None
+    #(renderer version,pdf bytes or jspdf blob) of the last output
+    self._output = None
+    #existing pdf the pages of this document are appended to -> open_existing()
+    self._base_pdf = None
+    #(on_pages,error_callback,file_name) between stream_pages() and end_stream()
+    self._page_stream = None
+
+    #Opt-in call counts and timings -> get_profile()
+    self.profiler = None
+    self.profile = profile
+    #Opt-in cache.RenderCache (server) -> documents drawn with identical inputs are read from disk
+    self.cache = cache
+    #cache.Recorder holding back the drawing calls while the output may come from the cache
+    self.recorder = None
+    self._attach()
+
+  def _attach(self):
+    '''wraps the methods of this instance for profiling and caching'''
+    if self.profile:
+      from . import profiling
+      self.profiler = profiling.Profiler(self)
+      self.profiler.attach()
+    if self.cache is not None:
+      from . import cache
+      self.recorder = cache.Recorder(self,self.cache)
+      self.recorder.attach()
     
     
-  def _set_renderer(self,is_server_side):
+  @classmethod
+  def open_existing(cls,pdf,**page_setup):
     '''
-    Sets the base implementaion of the library as a document object
+    Server only: returns a Document whose pages are appended to an existing pdf (bytes or media object)
+    The output is the original pdf unchanged followed by an incremental update with the new pages
+    page_no() continues after the existing pages, page size defaults to the size of the last existing page
+    '''
+    if not anvil.is_server_side():
+      raise NotImplementedError('open_existing is only available server side')
+    from . import incremental
+    pdf_bytes = pdf if isinstance(pdf,(bytes,bytearray)) else pdf.get_bytes()
+    page_count,width,height = incremental.get_page_info(pdf_bytes)
+    if width is not None:
+      page_setup.setdefault('page_width',width)
+      page_setup.setdefault('page_height',height)
+    document = cls(**page_setup)
+    document._base_pdf = bytes(pdf_bytes)
+    document.set_page_offset(page_count)
+    return document
+
+  def reset(self):
+    '''
+    Discards everything drawn so far, the next drawing call starts an empty document with the same page setup
+    Cheaper than a new Document: the fpdf renderer is emptied in place and keeps its added fonts,
+    the jspdf renderer is created again on first use
+    '''
+    if self.js_doc is not None:
+      raise NotImplementedError('documents drawing into a given js_doc cannot be reset')
+    if self._doc is not None and self.renderer_type == 'fpdf':
+      self._doc.reset()
+      self._configure_fpdf_renderer()
+    else:
+      self._doc = None
+      self._proxy_doc = None
+    self._output = None
+    self._base_pdf = None
+    self._page_stream = None
+    #method wrappers of profiling and caching belong to the previous renderer
+    for name in [name for name in vars(self) if callable(getattr(type(self),name,None))]:
+      delattr(self,name)
+    self._attach()
+
+  @property
+  def doc(self):
+    '''
+    The base implementaion of the library as a document object, jspdf in the browser and fpdf2 on the server
     This class primary purpose is to provide a common interface & code completion
     between fpdf2 and the python implementation of jspdf
     '''
-
+    if self._doc is None:
+      self._set_renderer()
+    if self.recorder is not None and self.recorder.calls:
+      #code using the renderer directly needs the drawing calls held back by the render cache
+      self.recorder.replay()
+    return self._doc
+
+  def _set_renderer(self):
     #Set proxy classes depending if code is executed on server or client runtime
-    if not self.server_side:
-      return self._set_jspdf_renderer()
+    if self.renderer_type == 'jspdf':
+      self._set_jspdf_renderer()
     else:
-      return self._set_fpdf_renderer()
+      self._set_fpdf_renderer()
 
 
   def _set_jspdf_renderer(self):
     from .jspdf import jsPdf
-    self.doc = jsPdf(self)
-    self._proxy_doc = self.doc.doc
-    return 'jspdf'
+    self._doc = jsPdf(self,self.js_doc)
+    self._proxy_doc = self._doc.doc
 
   def _set_fpdf_renderer(self):
     from .fpdf import CustomFPDF
-    self.doc = CustomFPDF(unit='mm',format=[self.page_width,self.page_height])
+    self._doc = CustomFPDF(unit='mm',format=[self.page_width,self.page_height])
+    self._configure_fpdf_renderer()
+
+  def _configure_fpdf_renderer(self):
     self.doc.header_callback = self.header_function
     self.doc.footer_callback = self.footer_function
     self.doc.footer_height = self.footer_height
@@ -70,8 +156,9 @@ class Document:
     self.doc.set_left_margin(self.margin_left)
     self.doc.set_right_margin(self.margin_right)
     self.doc.set_top_margin(self.margin_top)
+    if self.output_profile is not None:
+      self.doc.set_output_profile(self.output_profile)
     self._proxy_doc = self.doc
-    return 'fpdf'
     
   ###########################
   #Public Methods
@@ -105,6 +192,9 @@ class Document:
       Server: upload the my_font.ttf file to anvil storage -> name must be identical to "file_name"
       Client: provide a base64 representation for your font and pass it over to "base_64_font"
               Use something like: https://www.giftofspeed.com/base64-encoder/
+
+    Fonts are registered once per server process/browser page, later documents reuse the parsed font
+    (client side base_64_font can be omitted once a font was added for file_name)
     
     Args:
       file_name: name of the .ttf file store on anvil storage e.g poppins-medium.ttf
@@ -115,8 +205,8 @@ class Document:
     if self.renderer_type == 'jspdf':
       self.doc.add_font(file_name,font_name,base_64_font,font_style)
     else:
-      from anvil.files import data_files
-      self.doc.add_font(font_name,'',data_files[file_name])
+      from . import fonts
+      fonts.registry.add_to_fpdf(self.doc,file_name,font_name,'')
 
   def set_font(self,font_name,size=19,style=''):
     self.doc.set_font(font_name,style,size)
@@ -133,8 +223,79 @@ class Document:
   def vertical_text(self,width,height,text,border=0,ln=0,align='L',fill=False):
     self.doc.vertical_text(width,height,text,border=border,ln=ln,align=align,fill=fill)
     
-  def multi_cell(self,width,height,text,border=0,ln=0,align='L'):
-    self.doc.multi_cell(width,height,text,border=border,ln=ln,align=align)
+  def multi_cell(self,width,height,text,border=0,ln=0,align='L',mode='greedy',hyphenate=None):
+    '''
+    Draws text wrapped into lines of width, both renderers break lines with wrap.wrap_text
+
+    Args:
+      mode: 'greedy' (fill every line) or 'knuth_plass' (balanced line lengths)
+      hyphenate: optional wrap.Hyphenator or callable(word) -> split positions, soft hyphens are always used
+    '''
+    if self.renderer_type == 'fpdf' and align == 'J':
+      #justified lines need fpdf's word spacing
+      self.doc.multi_cell(width,height,text,border=border,ln=ln,align=align)
+      return
+    from . import wrap
+    #fpdf cells keep a margin on both sides of the text
+    lines = wrap.wrap_text(text or '',width - 2 * self.doc.c_margin,self.doc.get_string_width,mode,hyphenate)
+    #empty text is one empty line like in fpdf -> the cursor still moves down by height
+    self.doc.draw_lines(width,height,lines or [''],border=border,ln=ln,align=align)
+
+  def table(self,columns,rows,line_height=6,border=0,header=True,header_fill=False,sample_size=50):
+    '''
+    Draws a table, the header row is repeated after every page break
+
+    Args:
+      columns: list of titles, dicts or table.Column objects -> {'title':'Amount','width':30,'align':'R'}
+               columns without width share the remaining page width based on the first sample_size rows
+      rows: iterable or generator of row sequences, values are converted with str()
+      line_height: height of a single text line, cells with longer texts are wrapped
+    '''
+    from . import table
+    table.draw_table(self,columns,rows,line_height=line_height,border=border,header=header,header_fill=header_fill,sample_size=sample_size)
+
+  def layout(self,boxes):
+    '''
+    Computes page breaks and positions for a list of layout boxes without drawing anything
+    The returned layout.Layout knows the total page count and can be painted repeatedly with paint()
+    '''
+    from . import layout
+    return layout.compute_layout(self,boxes)
+
+  def box_builder(self):
+    '''returns a layout.BoxBuilder that turns cell/multi_cell/new_line calls into boxes for layout()'''
+    from . import layout
+    return layout.BoxBuilder(self)
+
+  def paint(self,layout,data=None):
+    '''draws a layout computed by layout(), data is handed to every Block.draw callable'''
+    layout.paint(self,data)
+
+  def compile_template(self,script):
+    '''
+    Records script(document,data) once with this page setup and returns a template.Template
+    data['name'] returns a template.Slot that can be used as text of cell(), render(data) only fills the slots
+    '''
+    from . import template
+    return template.compile_template(script,**self.get_page_setup())
+
+  def static_block(self,draw,dynamic=None):
+    '''
+    Returns a static.StaticBlock for content that is identical on every page, e.g. as header_function
+    draw(pdf) runs once, later pages reuse its output (server: pdf form xobject), dynamic(pdf) runs on every page
+    Server: form xobjects rely on fpdf2 internals and are only used with the versions in static.FORM_FPDF_VERSIONS,
+    with other versions the block is drawn on every page and a warning is printed (static.get_form_support(doc.doc))
+    '''
+    from . import static
+    return static.StaticBlock(draw,dynamic)
+
+  def draw_static(self,draw):
+    '''draws draw(pdf) at its recorded position, only the first call per document runs draw'''
+    self.doc.draw_static(draw)
+
+  def get_string_width(self,text):
+    '''returns the width of text with the current font in mm'''
+    return self.doc.get_string_width(text)
 
   def spacer(self,height):
     self.cell(1,height,'',ln=1)
@@ -145,6 +306,38 @@ class Document:
   def line(self,x_start,y_start,x_end,y_end):
     self.doc.line(x_start,y_start,x_end,y_end)
 
+  def rect(self,x,y,width,height,style='D'):
+    '''draws a rectangle, style: D (border), F (filled) or DF (both)'''
+    self.doc.rect(x,y,width,height,style)
+
+  def lines(self,coordinates):
+    '''
+    Draws many lines at once e.g. grids or charts -> one write to the content stream (server) or one bridge call (client)
+    coordinates: rows of (x_start,y_start,x_end,y_end), a flat sequence of those values or a numpy array
+    '''
+    self.doc.lines(utils.get_rows(coordinates,4))
+
+  def rects(self,rectangles,style='D'):
+    '''draws many rectangles at once like lines(), rectangles: rows of (x,y,width,height), style: D, F or DF'''
+    self.doc.rects(utils.get_rows(rectangles,4),style)
+
+  def cells(self,xs,ys,widths,texts,height=5,align='L',fill=False):
+    '''
+    Draws many single line cells at absolute positions at once e.g. chart labels or barcode digits
+    The current position does not change and pages never break, fill rectangles are drawn below all texts
+
+    Args:
+      xs,ys,texts: sequences or numpy arrays of the same length, texts are converted with str()
+      widths: sequence of widths or one width for all cells
+    '''
+    xs = utils.get_values(xs)
+    ys = utils.get_values(ys)
+    widths = utils.get_values(widths,len(xs))
+    texts = [text if isinstance(text,str) else str(text) for text in utils.get_values(texts)]
+    if not len(xs) == len(ys) == len(widths) == len(texts):
+      raise ValueError(f'xs, ys, widths and texts must have the same length, got {len(xs)}, {len(ys)}, {len(widths)} and {len(texts)}')
+    self.doc.cells(xs,ys,widths,texts,height,align=align,fill=fill)
+
   def set_y(self,value):
     self.doc.set_y(value)
     
@@ -157,6 +350,28 @@ class Document:
   def page_no(self):
     return self.doc.page_no()
 
+  def get_page_height(self):
+    '''returns the height of the current page format in mm'''
+    if self.renderer_type == 'jspdf':
+      return self.doc.page_height
+    return self.doc.h
+
+  def set_page_offset(self,offset):
+    '''numbers pages starting after offset e.g. when this document continues another one'''
+    self.doc.page_offset = offset
+
+  def get_page_setup(self):
+    '''returns the arguments needed to create a new document with an identical page setup'''
+    return {
+      'page_height':self.page_height,'page_width':self.page_width,
+      'margin_top':self.margin_top,'margin_bottom':self.margin_bottom,
+      'margin_left':self.margin_left,'margin_right':self.margin_right,
+      'header_height':self.header_height,'footer_height':self.footer_height,
+      'header_function':self.header_function,'footer_function':self.footer_function,
+      'orientation':self.orientation,'batch_ops':self.batch_ops,'worker':self.worker,
+      'output_profile':self.output_profile,
+    }
+
   def set_text_color(self,color_1,color_2=None,color_3=None):
     if color_2 != None and color_3 != None:
       self.doc.set_text_color(color_1,color_2,color_3)
@@ -187,6 +402,35 @@ class Document:
   def rotate(self,angle):
     self.doc.rotate(angle)
 
+  def bridge_calls_saved(self):
+    '''returns the number of jspdf bridge calls saved by batch_ops (always 0 server side)'''
+    if self.renderer_type == 'jspdf':
+      return self.doc.bridge_calls_saved
+    return 0
+
+  def get_profile(self):
+    '''
+    Returns the profiling data of a Document(profile=True) as a dict (None without profiling)
+      methods: calls and cumulative seconds per public method
+      phases: header/footer callbacks, uncached text measurement and output
+      images,fonts,text_widths: cache hits and misses since the document was created
+      bridge_calls: client side calls into jspdf
+    '''
+    if self.profiler is None:
+      return None
+    return self.profiler.get_report()
+
+  def get_size_report(self):
+    '''
+    Returns the size of the output and the bytes saved per category as a dict
+    Server: content (stream compression), images (downsampling), fonts (subsetting), object_streams
+    Client: images only, the pdf itself is not parsed in the browser
+    '''
+    from . import optimize
+    output = self._get_output()
+    size = len(output) if isinstance(output,bytes) else output.size
+    return optimize.get_size_report(self,size)
+
   def add_image(self,image_data,x=0,y=0,w=100,h=50,keep_aspect_ratio=True):
     '''Takes an image in form of a blob and prints it on the pdf'''          
     self.doc.add_image(image_data,x=x,y=y,w=w,h=h,keep_aspect_ratio=keep_aspect_ratio)
@@ -196,13 +440,180 @@ class Document:
   ###########################
   
   def to_blob(self,file_name = 'file'):
-    '''returns an anvil blob media with the type application/pdf'''
-    if self.server_side:
-      byte_string = bytes(self.doc.output())
-      return anvil.BlobMedia("application/pdf", byte_string, name=f"{file_name}.pdf")
+    '''
+    returns an anvil blob media with the type application/pdf
+    The output is kept until the document changes -> print, preview and download serialize the pdf once
+    '''
+    return self._output_to_media(self._get_output(),file_name)
+
+  def _get_output(self):
+    '''returns the pdf bytes (fpdf) or jspdf blob of the current document version'''
+    version = self.doc.version
+    if self._output is not None and self._output[0] == version:
+      return self._output[1]
+    if self.renderer_type == 'fpdf' and self._base_pdf is not None:
+      #without new pages fpdf would add an empty one
+      output = self._base_pdf
+      if self.doc.page:
+        from . import incremental
+        output = incremental.append_pages(self._base_pdf,bytes(self.doc.output()))
+    elif self.renderer_type == 'fpdf':
+      output = bytes(self.doc.output())
+      profile = self.output_profile
+      if profile is not None and profile.object_streams:
+        from . import optimize
+        packed = optimize.write_object_streams(output,profile.compression_level)
+        self.doc.object_stream_bytes_saved = len(output) - len(packed)
+        output = packed
     else:
-      return anvil.js.to_media(self._proxy_doc.output('blob'),content_type="application/pdf", name=f"{file_name}.pdf")
+      if self.doc.worker_ops is not None:
+        self.doc.replay_worker_ops()
+      self.doc.flush()
+      output = self.doc.doc.output('blob')
+    self._output = (version,output)
+    return output
 
+  def _is_output_current(self):
+    return self._output is not None and self._output[0] == self.doc.version
+
+  def to_blob_async(self,callback,file_name='file',progress_callback=None,error_callback=None):
+    '''
+    Calls callback with the pdf media once it is rendered, returns immediately
+    Client with Document(worker=True): jspdf renders the recorded document in a web worker
+                                        progress_callback(pages_done,total_pages) is called after every page
+    Otherwise the document is rendered synchronously before callback is called
+    '''
+    #server documents never touch the renderer here -> a render cache hit draws nothing
+    if self.renderer_type != 'jspdf' or self.doc.worker_ops is None or self._is_output_current():
+      media = self.to_blob(file_name)
+      if progress_callback:
+        progress_callback(self.page_no(),self.page_no())
+      callback(media)
+      return
+
+    version = self.doc.version
+    def on_error(message):
+      if error_callback is None:
+        raise Exception(f'pdf rendering in worker failed: {message}')
+      error_callback(message)
+    def on_done(output):
+      self._output = (version,output)
+      callback(self._output_to_media(output,file_name))
+    self.doc.render_async(on_done,progress_callback,on_error)
+
+  def stream_pages(self,on_pages,chunk_pages=10,error_callback=None,file_name='file'):
+    '''
+    Sends the pdf in ranges of chunk_pages pages, on_pages(first_page,last_page,media) receives every range as its own pdf
+    Call end_stream() after drawing the last page
+    Client with Document(worker=True): every range renders in its own web worker as soon as its pages are drawn,
+                                        pages drawn before the call are sent right away, ranges can arrive out of order
+    Otherwise the whole document arrives as a single range on end_stream()
+    '''
+    self._page_stream = (on_pages,error_callback,file_name)
+    if self.renderer_type == 'jspdf' and self.doc.worker_ops is not None:
+      self.doc.start_stream(self._render_page_range,chunk_pages)
+
+  def end_stream(self):
+    '''sends the last page range of stream_pages()'''
+    if self._page_stream is None:
+      raise RuntimeError('end_stream() called without stream_pages(), call stream_pages() before end_stream()')
+    on_pages,error_callback,file_name = self._page_stream
+    if self.renderer_type == 'jspdf' and self.doc.page_stream is not None:
+      self.doc.end_stream()
+    else:
+      on_pages(1,self.page_no() - self.doc.page_offset,self.to_blob(file_name))
+    self._page_stream = None
+
+  def _render_page_range(self,job):
+    on_pages,error_callback,file_name = self._page_stream
+    first_page = job['first_page']
+    last_page = first_page + job['pages'] - 1
+    def on_error(message):
+      if error_callback is None:
+        raise Exception(f'pdf rendering of pages {first_page}-{last_page} in worker failed: {message}')
+      error_callback(message)
+    def on_done(output):
+      on_pages(first_page,last_page,self._output_to_media(output,f'{file_name}_{first_page}-{last_page}'))
+    self.doc.render_async(on_done,on_error=on_error,job=job)
+
+  def _output_to_media(self,output,file_name):
+    #fpdf and headless jspdf documents return bytes
+    if isinstance(output,bytes):
+      return anvil.BlobMedia("application/pdf",output,name=f"{file_name}.pdf")
+    from anvil.js import to_media
+    return to_media(output,content_type="application/pdf", name=f"{file_name}.pdf")
+
+  def write_to(self,stream,chunk_size=1048576):
+    '''
+    Server only: writes the finished pdf into a binary file-like object and returns it
+    Saves the copy made by to_blob, the pdf is still serialized in memory at once (fpdf resolves pages at output)
+    -> write_sections() for documents too large to be kept in memory
+    '''
+    if self.renderer_type != 'fpdf':
+      raise NotImplementedError('write_to is only available server side, use to_blob instead')
+
+    #write slices of the output -> no additional copy of the whole document
+    buffer = memoryview(self._get_output())
+    for start in range(0,len(buffer),chunk_size):
+      stream.write(buffer[start:start+chunk_size])
+    buffer.release()
+    return stream
+
+  def to_file(self,path):
+    '''Server only: writes the pdf to the given file path and returns the path'''
+    with open(path,'wb') as file:
+      self.write_to(file)
+    return path
+
+  def write_sections(self,stream,sections):
+    '''
+    Server only: draws sections one after the other and writes each one into a binary file-like object as soon as
+    it is finished, the stream receives a single pdf -> memory depends on the largest section, not on the page count
+    e.g. a 20k page statement run with one section per customer, returns the stream
+
+    Args:
+      sections: iterable (e.g. a generator) of callables that draw one section into a Document with this page setup,
+                the document is reset between sections and keeps its fonts, page numbers continue over all sections
+    Every section embeds its own font subsets and images, output_profile object streams are not used
+    '''
+    if not self.server_side:
+      raise NotImplementedError('write_sections is only available server side')
+    from . import parallel
+    page_setup = self.get_page_setup()
+    profile = page_setup['output_profile']
+    if profile is not None and profile.object_streams:
+      #the sections are written object by object
+      import copy
+      profile = page_setup['output_profile'] = copy.copy(profile)
+      profile.object_streams = False
+    doc = Document(**page_setup)
+    writer = parallel.SectionWriter(stream)
+    page_offset = 0
+    for section in sections:
+      doc.reset()
+      doc.set_page_offset(page_offset)
+      section(doc)
+      page_offset += writer.add(doc._get_output())
+    writer.close()
+    return stream
+
+
+  def render_parallel(self,sections,workers=None,continuous_page_numbers=True,file_name='file'):
+    '''
+    Server only: renders independent sections in worker processes and merges them into one pdf
+
+    Args:
+      sections: picklable callables (module level functions) that receive a new Document with this page setup
+                and draw one section into it e.g. a single customer statement, fonts must be added by the section
+      workers: number of worker processes, defaults to the number of cpus
+      continuous_page_numbers: page_no() continues over all sections instead of restarting in each one
+                               (costs an additional drawing pass to count the pages when headers or footers are used)
+    '''
+    if not self.server_side:
+      raise NotImplementedError('render_parallel is only available server side')
+    from . import parallel
+    byte_string = parallel.render_parallel(self.get_page_setup(),sections,workers=workers,continuous_page_numbers=continuous_page_numbers)
+    return anvil.BlobMedia("application/pdf", byte_string, name=f"{file_name}.pdf")
 
   ###########################
   #Display modes for the pdf
@@ -223,4 +634,57 @@ class Document:
 
   def get_form(self):
     '''Returns a nestable component wich allows the pdf to be embedded into forms'''
-    return utils.pdf_to_component(self.to_blob())
\ No newline at end of file
+    return utils.pdf_to_component(self.to_blob())
+
+  def get_stream_form(self,chunk_pages=10):
+    '''
+    Returns a nestable component showing the pdf in page ranges -> stream_pages()
+    Ranges only appear progressively on the client with Document(worker=True), otherwise (server, client without worker)
+    all ranges are rendered by end_stream() before the form is returned
+    '''
+    from ..components.preview import preview
+    form = preview()
+    self.stream_pages(form.add_pages,chunk_pages=chunk_pages)
+    self.end_stream()
+    return form
+
+
+def render_batch(job,records,workers=None,page_setup=None,chunk_size=8,record_id=None,preload=None):
+  '''
+  Server only: renders one document per record in warm worker processes
+  Returns a generator of (record_id,pdf bytes or batch.RecordError) in the order of the records -> see batch.render_batch
+  batch.write_archive(results,stream) writes the results into a zip or tar stream as they arrive
+  '''
+  if not anvil.is_server_side():
+    raise NotImplementedError('render_batch is only available server side')
+  from . import batch
+  return batch.render_batch(job,records,workers=workers,page_setup=page_setup,chunk_size=chunk_size,record_id=record_id,preload=preload)
+
+
+def warm_up(fonts=(),images=()):
+  '''
+  Loads everything the first document of a process would load on first use -> call once at process or app start
+  Importing fast_pdf and creating a Document only import the renderer when it is drawn on
+
+  Args:
+    fonts: server only, (file_name,font_name) or (file_name,font_name,style) tuples parsed into the font registry
+    images: media objects decoded into the image registry
+  '''
+  from . import images as image_registry
+  if anvil.is_server_side():
+    from . import fonts as font_registry
+    for font in fonts:
+      font_registry.registry.preload_fpdf(*font)
+    #fpdf imports parts of its output code on the first output
+    document = Document()
+    document.add_page()
+    document._get_output()
+    form = 'pil'
+  else:
+    import base64
+    from anvil import js, media
+    from . import jspdf
+    from ..components.preview import preview
+    form = 'base_64'
+  for image in images:
+    image_registry.registry.get(image,form)
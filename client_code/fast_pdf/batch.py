@@ -0,0 +1,136 @@
+"""
+Server side batch rendering of many independent documents (one per record) e.g. invoices or certificates
+Worker processes stay alive for the whole batch -> fonts and images in the shared registries are parsed and
+decoded once per worker instead of once per document, records are sent to them in chunks
+Results come back in the order of the records, a failing record only fails its own document
+"""
+
+
+class RecordError(Exception):
+  '''returned in place of the pdf bytes of a record whose job raised an exception'''
+  def __init__(self,record_id,message,details=''):
+    super().__init__(f'record {record_id!r}: {message}')
+    self.record_id = record_id
+    self.message = message
+    #formatted traceback of the worker
+    self.details = details
+
+  def __reduce__(self):
+    #sent back from the worker processes
+    return RecordError,(self.record_id,self.message,self.details)
+
+
+def _init_worker(preload):
+  if preload is not None:
+    preload()
+
+
+def _render_record(job,page_setup,record_id,record):
+  from . import Document
+  try:
+    doc = Document(**page_setup)
+    job(doc,record)
+    return bytes(doc._get_output())
+  except Exception as error:
+    import traceback
+    return RecordError(record_id,f'{type(error).__name__}: {error}',traceback.format_exc())
+
+
+def _render_chunk(job,page_setup,chunk):
+  '''renders a list of (record_id,record) -> list of (record_id,pdf bytes or RecordError)'''
+  return [(record_id,_render_record(job,page_setup,record_id,record)) for record_id,record in chunk]
+
+
+def _get_results(future,chunk):
+  '''results of a chunk, every record of it fails if the worker could not return them'''
+  try:
+    return future.result()
+  except Exception as error:
+    return [(record_id,RecordError(record_id,f'{type(error).__name__}: {error}')) for record_id,record in chunk]
+
+
+def _get_chunks(records,record_id,chunk_size):
+  chunk = []
+  for index,record in enumerate(records):
+    chunk.append((index if record_id is None else record_id(record),record))
+    if len(chunk) == chunk_size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+
+def render_batch(job,records,workers=None,page_setup=None,chunk_size=8,record_id=None,preload=None):
+  '''
+  Renders one document per record and yields (record_id,pdf bytes) in the order of the records
+  A record whose job raises yields (record_id,RecordError) instead, the remaining records are rendered anyway
+
+  Args:
+    job: picklable callable(document,record) (module level function) drawing the document of one record
+    records: iterable of picklable records, consumed lazily
+    workers: number of worker processes, defaults to the number of cpus, 0 renders in the calling process
+    page_setup: Document arguments used for every document e.g. Document.get_page_setup()
+    chunk_size: records sent to a worker at once
+    record_id: optional callable(record) -> id, defaults to the index of the record
+    preload: optional picklable callable run once in every worker before its first record
+             e.g. adding fonts to a document and drawing logos so they are in the shared registries
+  '''
+  page_setup = page_setup or {}
+  chunks = _get_chunks(records,record_id,chunk_size)
+  if workers == 0:
+    _init_worker(preload)
+    for chunk in chunks:
+      yield from _render_chunk(job,page_setup,chunk)
+    return
+
+  import os
+  from collections import deque
+  from concurrent.futures import ProcessPoolExecutor
+  workers = workers or os.cpu_count() or 1
+  with ProcessPoolExecutor(max_workers=workers,initializer=_init_worker,initargs=(preload,)) as executor:
+    #a few chunks per worker in flight -> workers stay busy without reading all records into memory
+    pending = deque()
+    for chunk in chunks:
+      pending.append((executor.submit(_render_chunk,job,page_setup,chunk),chunk))
+      if len(pending) >= 2 * workers:
+        yield from _get_results(*pending.popleft())
+    while pending:
+      yield from _get_results(*pending.popleft())
+
+
+def write_archive(results,stream,archive_format='zip',get_file_name=None):
+  '''
+  Writes the pdfs of render_batch results into a zip or tar archive as they arrive
+  Failed records are left out of the archive -> returns the list of RecordErrors
+
+  Args:
+    results: iterable of (record_id,pdf bytes or RecordError)
+    stream: writable binary file-like object e.g. open(path,'wb') or io.BytesIO()
+    archive_format: 'zip' or 'tar'
+    get_file_name: optional callable(record_id) -> name inside the archive, defaults to "<record_id>.pdf"
+  '''
+  import io
+  if get_file_name is None:
+    get_file_name = lambda record_id: f'{record_id}.pdf'
+  errors = []
+  if archive_format == 'zip':
+    import zipfile
+    #pdf streams are already compressed
+    archive = zipfile.ZipFile(stream,'w',compression=zipfile.ZIP_STORED)
+  elif archive_format == 'tar':
+    import tarfile
+    archive = tarfile.open(fileobj=stream,mode='w|')
+  else:
+    raise ValueError(f'unknown archive format {archive_format!r}, use "zip" or "tar"')
+
+  with archive:
+    for record_id,output in results:
+      if isinstance(output,RecordError):
+        errors.append(output)
+      elif archive_format == 'zip':
+        archive.writestr(get_file_name(record_id),output)
+      else:
+        info = tarfile.TarInfo(get_file_name(record_id))
+        info.size = len(output)
+        archive.addfile(info,io.BytesIO(output))
+  return errors
@@ -0,0 +1,390 @@
+"""
+Server side render cache: Document(cache=RenderCache(directory)) returns the stored pdf of a document whose inputs
+were rendered before instead of rendering it again
+
+Drawing calls are recorded together with a fingerprint of their arguments and only replayed into the renderer when
+the output is not in the cache -> an identical rerun costs hashing its calls
+  images: content hash of the media bytes
+  fonts: file name, size and modification time of the font file (registered local path or anvil data file)
+  functions (header, footer, static blocks): qualified name, bytecode, constants, closure values and the current
+             values of the module globals they read, functions they call are encoded the same way (recursively)
+  modules: name and the attributes read by the function (config.COMPANY)
+  classes and modules: name
+  other objects: class name and public attributes
+Key contract: a callback may only depend on its arguments, closures, defaults and module globals, values it reads
+from elsewhere (files, databases, time, random, private attributes, objects reached only through other calls)
+are not part of the key -> do not use a cache for documents drawn with such callbacks
+Calls that need the renderer state (get_x, page_no, get_string_width, layout ...) replay the recorded calls first,
+later calls are drawn directly and still become part of the fingerprint
+Drawing errors of recorded calls are raised when the output is created
+
+Cached files are written atomically (temporary file + rename) and evicted least recently used beyond max_bytes
+"""
+
+from . import utils
+
+#part of every fingerprint -> changes of the recording format invalidate older entries
+FORMAT = 1
+
+#Document methods that only draw -> recorded until the output or a query needs the renderer
+DRAW_METHODS = (
+  'add_page','set_skip_header','set_skip_footer','add_font','set_font','cell','vertical_text','multi_cell','table',
+  'paint','draw_static','spacer','new_line','line','rect','set_y','set_x','set_xy','set_page_offset',
+  'set_text_color','set_draw_color','set_fill_color','set_line_width','rotate','add_image','lines','rects','cells',
+)
+#Document methods that neither draw nor depend on the drawn content
+PASSIVE_METHODS = ('open_existing','static_block','get_page_setup','reset','get_profile','bridge_calls_saved','render_parallel','write_sections')
+#output methods -> all of them create the pdf through Document._get_output
+OUTPUT_METHODS = ('to_blob','to_blob_async','write_to','to_file','print','download','preview','get_form','stream_pages','end_stream','get_stream_form')
+
+#nesting limit for encoding arguments e.g. closures referring to each other
+MAX_DEPTH = 8
+
+
+class RenderCache:
+  def __init__(self,directory,max_bytes=268435456,key=''):
+    '''
+    directory: local directory of the cached pdf files, created if missing, can be shared by several processes
+    max_bytes: upper bound for the size of all cached files, least recently used ones are deleted
+    key: part of every fingerprint e.g. an app version, changing it invalidates all entries
+    '''
+    import os
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.key = key
+    os.makedirs(directory,exist_ok=True)
+    self.lock = utils.create_lock()
+    self.hits = 0
+    self.misses = 0
+    self.stores = 0
+    self.evictions = 0
+
+  def _get_path(self,fingerprint):
+    import os
+    return os.path.join(self.directory,f'{fingerprint}.pdf')
+
+  def get(self,fingerprint):
+    '''returns the cached pdf bytes for fingerprint or None'''
+    import os
+    path = self._get_path(fingerprint)
+    try:
+      with open(path,'rb') as file:
+        data = file.read()
+    except OSError:
+      with self.lock:
+        self.misses += 1
+      return None
+    try:
+      #the modification time orders the entries for eviction
+      os.utime(path)
+    except OSError:
+      pass
+    with self.lock:
+      self.hits += 1
+    return data
+
+  def put(self,fingerprint,data):
+    '''stores data atomically and evicts the least recently used entries beyond max_bytes'''
+    import os
+    import tempfile
+    handle,temp_path = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+    try:
+      with os.fdopen(handle,'wb') as file:
+        file.write(data)
+      os.replace(temp_path,self._get_path(fingerprint))
+    except BaseException:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise
+    with self.lock:
+      self.stores += 1
+      self._evict()
+
+  def _get_entries(self):
+    '''returns (modification time,size,path) of all cached files'''
+    import os
+    entries = []
+    with os.scandir(self.directory) as items:
+      for item in items:
+        if item.name.endswith('.pdf'):
+          try:
+            stat = item.stat()
+          except OSError:
+            continue
+          entries.append((stat.st_mtime,stat.st_size,item.path))
+    return entries
+
+  def _evict(self):
+    import os
+    entries = self._get_entries()
+    size = sum(entry[1] for entry in entries)
+    if size <= self.max_bytes:
+      return
+    for mtime,entry_size,path in sorted(entries):
+      if size <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      size -= entry_size
+      self.evictions += 1
+
+  def clear(self):
+    import os
+    with self.lock:
+      for mtime,size,path in self._get_entries():
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+
+  def get_stats(self):
+    '''returns hit/miss statistics and the size of the cache directory as a dict'''
+    entries = self._get_entries()
+    lookups = self.hits + self.misses
+    return {
+      'hits':self.hits,
+      'misses':self.misses,
+      'hit_rate':self.hits / lookups if lookups else 0,
+      'stores':self.stores,
+      'evictions':self.evictions,
+      'entries':len(entries),
+      'size':sum(entry[1] for entry in entries),
+    }
+
+
+class Fingerprint:
+  def __init__(self):
+    import hashlib
+    self.hash = hashlib.sha256()
+    #id of encoded functions and objects -> shared or recursive references are encoded once
+    self.seen = {}
+
+  def add(self,*values):
+    for value in values:
+      self.hash.update(self.encode(value,0).encode('utf-8','surrogatepass'))
+      self.hash.update(b'\x00')
+
+  def hexdigest(self):
+    return self.hash.hexdigest()
+
+  def encode(self,value,depth):
+    '''returns a deterministic text representation of value'''
+    if value is None or isinstance(value,(bool,int,float,str)):
+      return repr(value)
+    if isinstance(value,(bytes,bytearray)):
+      from .images import content_hash
+      return f'b:{content_hash(bytes(value))}'
+    if hasattr(value,'tolist') and not hasattr(value,'__code__'):
+      #numpy arrays and numbers
+      return self.encode(value.tolist(),depth)
+    if depth > MAX_DEPTH:
+      return f'<{type(value).__name__}>'
+    if isinstance(value,(list,tuple)):
+      return '[' + ','.join(self.encode(item,depth + 1) for item in value) + ']'
+    if isinstance(value,dict):
+      items = sorted((self.encode(key,depth + 1),self.encode(item,depth + 1)) for key,item in value.items())
+      return '{' + ','.join(f'{key}:{item}' for key,item in items) + '}'
+    if isinstance(value,(set,frozenset)):
+      return '{' + ','.join(sorted(self.encode(item,depth + 1) for item in value)) + '}'
+    if hasattr(value,'get_bytes'):
+      #anvil media object
+      from .images import content_hash
+      return f'media:{content_hash(value.get_bytes())}'
+    if isinstance(value,type):
+      #classes and modules by name, their code only changes with a new process
+      return f'class:{value.__module__}.{value.__qualname__}'
+    if _is_module(value):
+      return f'module:{value.__name__}'
+
+    known = self.seen.get(id(value))
+    if known is not None:
+      return known
+    self.seen[id(value)] = f'<ref {len(self.seen)}>'
+    code = getattr(value,'__code__',None)
+    if code is not None:
+      text = self._encode_function(value,code,depth)
+    elif hasattr(value,'__func__'):
+      #bound method
+      text = f'method:{self.encode(value.__func__,depth + 1)}@{self.encode(value.__self__,depth + 1)}'
+    elif hasattr(value,'__dict__') or hasattr(value,'__slots__'):
+      text = f'{type(value).__module__}.{type(value).__qualname__}{self.encode(_get_attributes(value),depth + 1)}'
+    else:
+      text = f'{type(value).__module__}.{type(value).__qualname__}:{value!r}'
+    self.seen[id(value)] = text
+    return text
+
+  def _encode_function(self,function,code,depth):
+    from .images import content_hash
+    closure = [cell.cell_contents for cell in (function.__closure__ or ()) if _has_contents(cell)]
+    names = _get_code_names(code)
+    function_globals = getattr(function,'__globals__',{})
+    referenced = {}
+    for name in names:
+      if name in function_globals:
+        value = function_globals[name]
+        #module attributes read by the function e.g. config.COMPANY
+        referenced[name] = _get_module_attributes(value,names) if _is_module(value) else value
+    parts = [
+      f'{function.__module__}.{function.__qualname__}',
+      content_hash(code.co_code),
+      self.encode([constant for constant in code.co_consts if not hasattr(constant,'co_code')],depth + 1),
+      #nested functions
+      ','.join(content_hash(constant.co_code) for constant in code.co_consts if hasattr(constant,'co_code')),
+      self.encode(closure,depth + 1),
+      self.encode(function.__defaults__,depth + 1),
+      self.encode(referenced,depth + 1),
+    ]
+    return 'function:' + '|'.join(parts)
+
+
+def _get_code_names(code):
+  '''global and attribute names used by code and its nested functions'''
+  names = set(code.co_names)
+  for constant in code.co_consts:
+    if hasattr(constant,'co_code'):
+      names.update(_get_code_names(constant))
+  return names
+
+
+def _is_module(value):
+  return type(value).__name__ == 'module'
+
+
+def _get_module_attributes(module,names):
+  return [module,{name:getattr(module,name) for name in names if hasattr(module,name)}]
+
+
+def _has_contents(cell):
+  try:
+    cell.cell_contents
+  except ValueError:
+    return False
+  return True
+
+
+def _get_attributes(value):
+  '''public attributes, private ones are treated as caches or internal state'''
+  attributes = {name:item for name,item in getattr(value,'__dict__',{}).items() if not name.startswith('_')}
+  for name in getattr(type(value),'__slots__',()):
+    if not name.startswith('_') and hasattr(value,name):
+      attributes[name] = getattr(value,name)
+  return attributes
+
+
+def _get_font_file(file_name):
+  '''size and modification time of the font file, registered local path or anvil data file'''
+  import os
+  from . import fonts
+  try:
+    stat = os.stat(fonts.registry.get_path(file_name))
+  except Exception:
+    #no local file -> adding the font fails when the document is drawn
+    return None
+  return (stat.st_size,stat.st_mtime)
+
+
+def _materialize_iterators(args,kwargs):
+  '''iterators (e.g. table rows from a generator) can only be consumed once -> lists for hashing and replaying'''
+  if any(_is_iterator(arg) for arg in args):
+    args = tuple(list(arg) if _is_iterator(arg) else arg for arg in args)
+  if any(_is_iterator(value) for value in kwargs.values()):
+    kwargs = {key:list(value) if _is_iterator(value) else value for key,value in kwargs.items()}
+  return args,kwargs
+
+
+def _is_iterator(value):
+  try:
+    return iter(value) is value
+  except TypeError:
+    return False
+
+
+class Recorder:
+  def __init__(self,document,cache):
+    self.document = document
+    self.cache = cache
+    self.fingerprint = Fingerprint()
+    #(method,args,kwargs) waiting to be drawn, None once the renderer is in use
+    self.calls = []
+    #(fingerprint,pdf bytes) read from the cache
+    self.output = None
+    #nested Document calls are part of the outer call
+    self.depth = 0
+
+  def attach(self):
+    document = self.document
+    if document.renderer_type != 'fpdf':
+      raise NotImplementedError('the render cache is only available server side')
+    self.fingerprint.add(FORMAT,self.cache.key,document.renderer_type,document.get_page_setup())
+    for name in dir(type(document)):
+      if name.startswith('_') or not callable(getattr(type(document),name)):
+        continue
+      if name in DRAW_METHODS:
+        setattr(document,name,self._wrap_draw(name,getattr(document,name)))
+      elif name not in PASSIVE_METHODS and name not in OUTPUT_METHODS:
+        setattr(document,name,self._wrap_query(name,getattr(document,name)))
+    get_output = document._get_output
+    document._get_output = lambda: self.get_output(get_output)
+
+  def _wrap_draw(self,name,method):
+    def recorded(*args,**kwargs):
+      if self.depth:
+        return method(*args,**kwargs)
+      args,kwargs = _materialize_iterators(args,kwargs)
+      self.fingerprint.add(name,args,kwargs)
+      if name == 'add_font':
+        self.fingerprint.add(_get_font_file(args[0] if args else kwargs.get('file_name')))
+      if self.calls is not None:
+        self.calls.append((method,args,kwargs))
+        return None
+      return self._call(method,args,kwargs)
+    return recorded
+
+  def _wrap_query(self,name,method):
+    def query(*args,**kwargs):
+      if self.depth:
+        return method(*args,**kwargs)
+      self.replay()
+      self.fingerprint.add(name,args,kwargs)
+      return self._call(method,args,kwargs)
+    return query
+
+  def _call(self,method,args,kwargs):
+    self.depth += 1
+    try:
+      return method(*args,**kwargs)
+    finally:
+      self.depth -= 1
+
+  def replay(self):
+    '''draws the recorded calls, later calls are drawn directly'''
+    calls = self.calls
+    if calls is None:
+      return
+    self.calls = None
+    for method,args,kwargs in calls:
+      self._call(method,args,kwargs)
+
+  def get_key(self):
+    fingerprint = self.fingerprint.hash.copy()
+    base_pdf = self.document._base_pdf
+    if base_pdf is not None:
+      from .images import content_hash
+      fingerprint.update(content_hash(base_pdf).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+  def get_output(self,get_output):
+    key = self.get_key()
+    if self.output is not None and self.output[0] == key:
+      return self.output[1]
+    output = self.cache.get(key)
+    if output is not None:
+      #the renderer is never needed -> keep recording, replay only if something is drawn afterwards
+      self.output = (key,output)
+      return output
+    self.replay()
+    output = get_output()
+    self.cache.put(key,output)
+    return output
@@ -0,0 +1,151 @@
+"""
+Font registry shared by all documents
+Server: each ttf file is parsed once per process, documents get a copy that shares the parsed metrics
+Client: base64 fonts and measured glyph widths are kept for the page lifetime
+"""
+
+
+class FontRegistry:
+  def __init__(self):
+    #server: (file_name,style) -> parsed fpdf font used as template
+    self.fpdf_fonts = {}
+    #server: file_name -> local path used instead of anvil data files
+    self.paths = {}
+    #client: file_name -> base64 representation of the ttf file
+    self.base_64_fonts = {}
+    #client: file_name -> content hash of the base64 font
+    self.base_64_hashes = {}
+    #client: glyph widths and kerning per (font_name,style,content hash) shared by the text measurers of all documents
+    self.glyphs = {}
+    self.kerning = {}
+
+    self.hits = 0
+    self.misses = 0
+    #documents rendered in several threads share the registry
+    from .utils import create_lock
+    self.lock = create_lock()
+
+  def add_to_fpdf(self,doc,file_name,font_name,style=''):
+    '''adds the font stored as file_name in anvil data files to an fpdf document'''
+    fontkey = f"{font_name.lower()}{style}"
+    if fontkey in doc.fonts:
+      return
+
+    template = self._get_fpdf_template(file_name,font_name,style)
+    if getattr(template,'color_font',None) is not None:
+      #color fonts keep document specific state -> let fpdf parse the file itself
+      doc.add_font(font_name,style,self.get_path(file_name))
+      return
+    try:
+      doc.fonts[fontkey] = self._copy_fpdf_font(template,doc,fontkey)
+    except AttributeError:
+      #unknown fpdf2 font structure -> let fpdf parse the file itself
+      doc.add_font(font_name,style,self.get_path(file_name))
+
+  def preload_fpdf(self,file_name,font_name,style=''):
+    '''parses the font stored as file_name once so later documents only copy it'''
+    self._get_fpdf_template(file_name,font_name,style)
+
+  def _get_fpdf_template(self,file_name,font_name,style):
+    key = (file_name,style)
+    #parsed once per process even if several threads need the font at the same time
+    with self.lock:
+      template = self.fpdf_fonts.get(key)
+      if template is not None:
+        self.hits += 1
+        return template
+
+      self.misses += 1
+      from fpdf import FPDF
+      parser = FPDF()
+      parser.add_font(font_name,style,self.get_path(file_name))
+      template = self.fpdf_fonts[key] = parser.fonts[f"{font_name.lower()}{style}"]
+      return template
+
+  def _copy_fpdf_font(self,template,doc,fontkey):
+    '''shares the read-only metrics of template by reference, everything a document modifies while rendering is created fresh'''
+    font = copy_font(template)
+    font.i = len(doc.fonts) + 1
+    font.fontkey = fontkey
+    clear_font_state(font)
+    font.color_font = None
+    return font
+
+  def register_path(self,file_name,path):
+    '''Server: loads file_name from a local path instead of anvil data files (uplink scripts, benchmarks)'''
+    self.paths[file_name] = path
+
+  def get_path(self,file_name):
+    if file_name in self.paths:
+      return self.paths[file_name]
+    from anvil.files import data_files
+    return data_files[file_name]
+
+  def get_base_64(self,file_name,base_64_font=None):
+    '''stores base_64_font for file_name or returns the one stored before'''
+    if base_64_font:
+      self.misses += 1
+      self.base_64_fonts[file_name] = base_64_font
+      from .images import content_hash
+      self.base_64_hashes[file_name] = content_hash(base_64_font.encode())
+      return base_64_font
+    if file_name not in self.base_64_fonts:
+      raise ValueError(f"No base64 font provided for {file_name}")
+    self.hits += 1
+    return self.base_64_fonts[file_name]
+
+  def get_stats(self):
+    '''returns hit/miss statistics as a dict'''
+    lookups = self.hits + self.misses
+    return {
+      'hits':self.hits,
+      'misses':self.misses,
+      'hit_rate':self.hits / lookups if lookups else 0,
+      'fpdf_fonts':len(self.fpdf_fonts),
+      'base_64_fonts':len(self.base_64_fonts),
+    }
+
+
+def reopen_ttfont(font):
+  '''replaces the fontTools object of a copied font with a new lazily loaded one'''
+  from fontTools import ttLib
+  font.ttfont = ttLib.TTFont(font.ttffile,recalcTimestamp=False,fontNumber=getattr(font,'collection_font_number',0),lazy=True)
+  font._hbfont = None
+
+
+#only read after a font is parsed -> shared by all copies
+SHARED_TABLES = ('cw','glyph_ids','cmap','desc')
+
+
+def copy_font(font):
+  '''copies an fpdf font with its subset state, the read-only metric tables are shared by reference'''
+  import copy
+  memo = {}
+  for name in SHARED_TABLES:
+    table = getattr(font,name,None)
+    if table is not None:
+      memo[id(table)] = table
+  ttfont = getattr(font,'ttfont',None)
+  if ttfont is not None:
+    #replaced below -> not copied, the original is only read (safe from several threads)
+    memo[id(ttfont)] = None
+  font = copy.deepcopy(font,memo)
+  subset = getattr(font,'subset',None)
+  if subset is not None:
+    #fpdf's deepcopy of a font gives the subset a second copy of the font
+    subset.font = font
+  if ttfont is not None:
+    #fpdf subsets the fontTools object in place during output -> every copy needs its own one
+    reopen_ttfont(font)
+  return font
+
+
+def clear_font_state(font):
+  '''starts the glyph subset of a ttf font again -> nothing drawn by a previous document is embedded'''
+  font.subset = type(font.subset)(font)
+  font.missing_glyphs = []
+  font.biggest_size_pt = 0
+
+
+#shared by all documents
+registry = FontRegistry()
@@ -1,7 +1,166 @@
+import zlib
+
 from fpdf import FPDF
+from fpdf.output import OutputProducer, PDFFontStream
+from fpdf.syntax import Name, PDFContentStream
+
+from . import measure
+from . import state
+
+#streams fpdf compresses when compression is on -> get the zlib level of the output profile
+#fpdf trace labels of the streams written for pages (and form xobjects: images), fonts and images
+STREAM_LABELS = ('pages','fonts','images')
+
+
+class CustomOutputProducer(OutputProducer):
+  '''
+  Keeps the trace label of every stream object -> optimize.get_size_report attributes the stream bytes by it
+  fpdf only has a process wide zlib level -> with a level in the output profile the document is output with
+  compression off and the streams are compressed here with that level
+  '''
+  def _add_pdf_obj(self,pdf_obj,trace_label=None):
+    is_stream = isinstance(pdf_obj,PDFContentStream) and trace_label in STREAM_LABELS
+    level = self.fpdf.output_level
+    if is_stream and level is not None:
+      if pdf_obj.filter is None:
+        _set_stream_contents(pdf_obj,zlib.compress(pdf_obj.content_stream(),level))
+      elif type(pdf_obj) is PDFFontStream:
+        #font files are always compressed with the default level
+        _set_stream_contents(pdf_obj,zlib.compress(zlib.decompress(pdf_obj.content_stream()),level))
+    obj_id = super()._add_pdf_obj(pdf_obj,trace_label)
+    if is_stream:
+      self.fpdf.stream_labels[obj_id] = trace_label
+    return obj_id
+
+
+def _set_stream_contents(pdf_obj,data):
+  pdf_obj._contents = data
+  pdf_obj.filter = Name('FlateDecode')
+  pdf_obj.length = len(data)
 
 
 class CustomFPDF(FPDF): 
+  #added to page_no() -> sections rendered on their own can continue the numbering of a larger document
+  page_offset = 0
+  #known before drawing when a precomputed layout is painted
+  total_pages = None
+  #fpdf does not accept drawing after output() -> the output of a document never changes
+  version = 0
+  #optimize.OutputProfile or None
+  output_profile = None
+  #bytes saved by writing object streams, set by the document output
+  object_stream_bytes_saved = 0
+  #object number -> fpdf trace label of the streams of the last output
+  stream_labels = None
+  #zlib level CustomOutputProducer compresses the streams of the running output with, None: fpdf compresses them
+  output_level = None
+
+  def __init__(self,*args,**kwargs):
+    super().__init__(*args,**kwargs)
+    #reset() starts again with the same arguments
+    self.init_arguments = (args,kwargs)
+    #content hash -> name of the image in fpdf's image cache
+    self.image_names = {}
+    #plain text widths are summed up from cached glyph widths
+    self.measurer = measure.TextMeasurer(self._get_unit_width,self.k)
+    #static block draw function -> static.StaticForm
+    self.static_forms = {}
+    #name of the embedded image -> size of its source file in bytes
+    self.image_source_bytes = {}
+    #arguments of the last font and color changes -> repeated ones return before fpdf parses them again
+    self.sent_state = state.GraphicsState()
+
+  def set_font(self,family=None,style='',size=0):
+    sent = self.sent_state
+    #same arguments as the last call and fpdf still uses the font and size they selected (add_page clears font_family)
+    if family and size and family == self.font_family and family == sent.font_name and style == sent.font_style and size == sent.font_size and self.font_size_pt == size and self.current_font is sent.font_object:
+      return
+    super().set_font(family,style,size)
+    sent.font_name = family
+    sent.font_style = style
+    sent.font_size = size
+    sent.font_object = self.current_font
+
+  #colors are compared with the arguments and fpdf's color object set with them -> no color object per call
+  def set_draw_color(self,r,g=-1,b=-1):
+    sent = self.sent_state.draw_color
+    if sent is not None and sent[1] is self.draw_color and sent[0] == (r,g,b):
+      return
+    super().set_draw_color(r,g,b)
+    self.sent_state.draw_color = ((r,g,b),self.draw_color)
+
+  def set_fill_color(self,r,g=-1,b=-1):
+    sent = self.sent_state.fill_color
+    if sent is not None and sent[1] is self.fill_color and sent[0] == (r,g,b):
+      return
+    super().set_fill_color(r,g,b)
+    self.sent_state.fill_color = ((r,g,b),self.fill_color)
+
+  def set_text_color(self,r,g=-1,b=-1):
+    sent = self.sent_state.text_color
+    if sent is not None and sent[1] is self.text_color and sent[0] == (r,g,b):
+      return
+    super().set_text_color(r,g,b)
+    self.sent_state.text_color = ((r,g,b),self.text_color)
+
+  def reset(self):
+    '''
+    empties the document in place for the next job, the added fonts and measured text widths are kept
+    everything else (pages, images, static forms, graphics state, settings) starts like in a new document
+    '''
+    from . import fonts
+    args,kwargs = self.init_arguments
+    kept_fonts = self.fonts
+    if any(getattr(font,'color_font',None) is not None for font in kept_fonts.values()):
+      #color fonts keep document specific state -> added again by the next job
+      kept_fonts = {}
+    measurer = self.measurer
+    #also drops wrappers (profiling) and values set on the instance (page_offset, total_pages, version)
+    self.__dict__.clear()
+    self.__init__(*args,**kwargs)
+
+    for font in kept_fonts.values():
+      if getattr(font,'ttfont',None) is not None:
+        fonts.clear_font_state(font)
+        #output subsets the fontTools object in place
+        fonts.reopen_ttfont(font)
+    self.fonts.update(kept_fonts)
+    measurer.unit_width_function = self._get_unit_width
+    self.measurer = measurer
+
+  def set_output_profile(self,profile):
+    self.output_profile = profile
+    self.set_compression(profile.compress)
+
+  @property
+  def compression_level(self):
+    '''zlib level of the output profile, None for fpdf's default level or without compression'''
+    profile = self.output_profile
+    return profile.compression_level if profile is not None and self.compress else None
+
+  def output(self,*args,**kwargs):
+    self.stream_labels = {}
+    self.output_level = self.compression_level
+    if self.output_level is None:
+      return super().output(*args,output_producer_class=CustomOutputProducer,**kwargs)
+    #streams are created uncompressed and compressed by CustomOutputProducer
+    self.compress = False
+    try:
+      return super().output(*args,output_producer_class=CustomOutputProducer,**kwargs)
+    finally:
+      self.compress = True
+      self.output_level = None
+
+  def page_no(self):
+    return self.page + self.page_offset
+
+  def get_string_width(self,s,normalized=False,markdown=False):
+    if normalized or markdown or not self.font_family or self.char_spacing or self.font_stretching != 100 or getattr(self,'text_shaping',None):
+      return super().get_string_width(s,normalized,markdown)
+    return self.measurer.get_string_width(s,(self.font_family,self.font_style,self.font_size_pt))
+
+  def _get_unit_width(self,text):
+    return super().get_string_width(text) * self.k / self.font_size_pt
   
   def footer(self):
     try:
@@ -18,21 +177,160 @@ class CustomFPDF(FPDF):
     except Exception as e:
       print('header error',e)
       
+  def draw_static(self,draw):
+    '''draws draw(self) once into a form xobject and references it on every later call'''
+    from . import static
+    form = self.static_forms.get(draw)
+    if form is None:
+      #False -> fpdf version without form xobject support
+      form = self.static_forms[draw] = static.record_fpdf_form(self,draw) or False
+    if form is False:
+      draw(self)
+      return
+    from fpdf.enums import PDFResourceType
+    self._out(f'q /I{form.index} Do Q')
+    self._resource_catalog.add(PDFResourceType.X_OBJECT,form.index,self.page)
+    self.set_xy(form.x,form.y)
+
+  def draw_lines(self,w,h,lines,border=0,ln=0,align='L'):
+    '''
+    draws already wrapped lines as one block like multi_cell
+    ln: 0 right of the last line, 1 next line, 2 below, 3 right of the first line
+    '''
+    if ln not in (0,1,2,3):
+      raise ValueError(f'ln must be 0, 1, 2 or 3, got {ln}')
+    from fpdf.enums import XPos, YPos
+    x = self.x
+    top,page = self.y,self.page
+    if border == 1:
+      border = 'LTRB'
+    last = len(lines) - 1
+    for index,line in enumerate(lines):
+      line_border = border
+      if border:
+        #top border only on the first and bottom border only on the last line
+        line_border = ''.join(side for side in border if (side != 'T' or index == 0) and (side != 'B' or index == last))
+      self.set_x(x)
+      self.cell(w,h,line,border=line_border,align=align,new_x=XPos.LEFT,new_y=YPos.NEXT)
+      if self.page != page:
+        #continued on a new page -> the block starts at the top of that page like in fpdf
+        top,page = self.y - h,self.page
+
+    if ln == 0:
+      self.set_x(x + w)
+    elif ln == 1:
+      self.set_x(self.l_margin)
+    elif ln == 3:
+      self.set_xy(x + w,top)
+
+  def lines(self,rows):
+    '''draws rows of (x_start,y_start,x_end,y_end) with a single write to the content stream'''
+    if not rows:
+      return
+    k,page_height = self.k,self.h
+    self._out('\n'.join(f'{x1 * k:.2f} {(page_height - y1) * k:.2f} m {x2 * k:.2f} {(page_height - y2) * k:.2f} l S' for x1,y1,x2,y2 in rows))
+
+  def rects(self,rows,style='D'):
+    '''draws rows of (x,y,w,h) with a single write to the content stream'''
+    if not rows:
+      return
+    from fpdf.enums import RenderStyle
+    operator = RenderStyle.coerce(style).operator
+    k,page_height = self.k,self.h
+    self._out('\n'.join(f'{x * k:.2f} {(page_height - y) * k:.2f} {w * k:.2f} {-h * k:.2f} re {operator}' for x,y,w,h in rows))
+
+  def cells(self,xs,ys,widths,texts,height,align='L',fill=False):
+    '''
+    draws single line cells at absolute positions, the current position stays and pages never break
+    plain text is written with a single write to the content stream, fill rectangles below all texts
+    '''
+    from fpdf.enums import TextMode
+    styled = self.char_spacing or self.font_stretching != 100 or getattr(self,'text_shaping',None)
+    if styled or not self.font_family or self.underline or self.strikethrough or self.text_mode != TextMode.FILL:
+      #styled text needs fpdf's text rendering
+      self._draw_cells(xs,ys,widths,texts,height,align,fill)
+      return
+    k,page_height = self.k,self.h
+    font = self.current_font
+    parts = []
+    if not self.current_font_is_set_on_page:
+      parts.append(self._set_font_for_page(font,self.font_size_pt))
+    if fill:
+      parts.extend(f'{x * k:.2f} {(page_height - y) * k:.2f} {w * k:.2f} {-height * k:.2f} re f' for x,y,w in zip(xs,ys,widths))
+    #text is painted with the fill color -> set for the texts only like fpdf's cell does
+    parts.append('q' if self.text_color == self.fill_color else f'q {self.text_color.serialize().lower()}')
+    baseline = 0.5 * height + 0.3 * self.font_size
+    for x,y,w,text in zip(xs,ys,widths,texts):
+      if not text:
+        continue
+      text = self.normalize_text(text)
+      if align == 'R':
+        dx = w - self.c_margin - self.get_string_width(text)
+      elif align == 'C':
+        dx = (w - self.get_string_width(text)) / 2
+      else:
+        dx = self.c_margin
+      parts.append(f'BT {(x + dx) * k:.2f} {(page_height - y - baseline) * k:.2f} Td {font.encode_text(text)} ET')
+    parts.append('Q')
+    self._out('\n'.join(parts))
+
+  def _draw_cells(self,xs,ys,widths,texts,height,align,fill):
+    x,y = self.x,self.y
+    auto_page_break = self.auto_page_break
+    self.set_auto_page_break(False,self.b_margin)
+    try:
+      for cell_x,cell_y,w,text in zip(xs,ys,widths,texts):
+        self.set_xy(cell_x,cell_y)
+        self.cell(w,height,text,align=align,fill=fill)
+    finally:
+      self.set_auto_page_break(auto_page_break,self.b_margin)
+      self.x,self.y = x,y
+
   def add_image(self,image_data,x=0,y=0,w=0,h=0,alias='',compression='MEDIUM',rotation=0,keep_aspect_ratio=True):
     '''Takes an image in form of a blob and prints it on the pdf'''
-    from . import utils
+    from . import images
+    entry = images.registry.get(image_data,'pil')
     if keep_aspect_ratio:
-      d_width,d_height = utils.get_image_dimenstions(image_data)
-      image_ar = d_width/d_height
+      image_ar = entry.width/entry.height
       pdf_ar = w/h
       if image_ar < pdf_ar:
         #adjust height
         w = h * image_ar
       else:
         h = w / image_ar
-        
-    image_data = utils.media_obj_to_pil(image_data)
-    self.image(image_data,x,y,w,h)
+
+    profile = self.output_profile
+    key = entry.key
+    image = entry.pil_image
+    if profile is not None and profile.image_dpi:
+      from . import optimize
+      #one embedded copy per drawn size
+      key = (entry.key,optimize.get_target_size(w,h,profile.image_dpi))
+      if key not in self.image_names:
+        image = optimize.downsample(entry.pil_image,w,h,profile) or image
+
+    #images already embedded in this document are referenced by name -> no decoding or hashing by fpdf
+    name = self.image_names.get(key)
+    if name:
+      self.image(name,x,y,w,h)
+    else:
+      self._add_new_image(key,entry,image,x,y,w,h)
+
+  def _add_new_image(self,key,entry,image,x,y,w,h):
+    info = self.image(image,x,y,w,h)
+    name = self.image_names[key] = self._get_image_name(info)
+    self.image_source_bytes[name] = entry.byte_size
+    level = self.compression_level
+    if level is not None and info.get('f') == 'FlateDecode' and info.get('usages') == 1:
+      #fpdf compresses images with its process wide level when they are added
+      for data_key in ('data','smask'):
+        if info.get(data_key):
+          info[data_key] = zlib.compress(zlib.decompress(info[data_key]),level)
+
+  def _get_image_name(self,info):
+    '''name of the embedded image whose info dict image() returned'''
+    cache = self.image_cache.images if hasattr(self,'image_cache') else self.images
+    return next((name for name,cached in cache.items() if cached is info),None)
     
   def vertical_text(self,width,height,text,border=0,ln=0,align='L',fill=False):
     self.rotate(90)
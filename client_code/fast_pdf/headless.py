@@ -0,0 +1,119 @@
+"""
+Python stand-in for the jspdf proxy object
+Lets the jspdf renderer run without a browser (benchmarks, parity checks), every call that would
+cross the python -> javascript bridge is recorded and counted
+"""
+
+import json
+
+
+class _Internal:
+  def __init__(self,scale_factor):
+    self.scaleFactor = scale_factor
+
+
+def _get_style_suffix(style):
+  style = (style or '').lower()
+  bold = 'b' in style.replace('normal','')
+  italic = 'i' in style or 'oblique' in style
+  return ('B' if bold else '') + ('I' if italic else '')
+
+
+class HeadlessJsPDF:
+  def __init__(self,orientation='portrait',unit='mm',format=None):
+    self.orientation = orientation
+    self.format = format
+    self.internal = _Internal(72/25.4)
+    #recorded drawing calls -> [method,*args]
+    self.calls = []
+    self.bridge_calls = 0
+    self.font_name = 'helvetica'
+    self.font_style = ''
+    self.font_size = 16
+
+  def __getattr__(self,name):
+    if name.startswith('_'):
+      raise AttributeError(name)
+    def call(*args):
+      self.bridge_calls += 1
+      self.calls.append([name] + list(args))
+    return call
+
+  def setFont(self,font_name,style=''):
+    self.bridge_calls += 1
+    self.calls.append(['setFont',font_name,style])
+    self.font_name = font_name
+    self.font_style = _get_style_suffix(style)
+
+  def setFontSize(self,size):
+    self.bridge_calls += 1
+    self.calls.append(['setFontSize',size])
+    self.font_size = size
+
+  def getStringUnitWidth(self,text):
+    self.bridge_calls += 1
+    widths = get_core_font_widths(self.font_name,self.font_style)
+    if widths is None:
+      return len(text) * 0.5
+    return sum(widths.get(char,500) for char in text) / 1000
+
+  def getTextDimensions(self,text):
+    self.bridge_calls += 1
+    return {'w':self.getStringUnitWidth(text) * self.font_size / self.internal.scaleFactor}
+
+  def output(self,type=None):
+    '''returns the recorded calls serialized as json bytes'''
+    self.bridge_calls += 1
+    return json.dumps(self.calls).encode('utf-8')
+
+
+def get_core_font_widths(font_name,style=''):
+  '''returns the afm widths (1/1000 em) of a standard pdf font taken from fpdf2 or None'''
+  try:
+    from fpdf.fonts import CORE_FONTS_CHARWIDTHS
+  except ImportError:
+    return None
+  font_name = font_name.lower()
+  if font_name == 'arial':
+    font_name = 'helvetica'
+  if font_name in ('symbol','zapfdingbats'):
+    style = ''
+  return CORE_FONTS_CHARWIDTHS.get(font_name + style)
+
+
+def replay(doc,ops):
+  '''python version of the fastPdfReplay javascript function'''
+  doc.bridge_calls -= len(ops) - 1
+  for op in ops:
+    getattr(doc,op[0])(*op[1:])
+
+
+def render_in_worker(job,on_progress,on_done,on_error):
+  '''python version of the fastPdfRenderInWorker javascript function, runs synchronously'''
+  try:
+    #the worker receives a structured clone -> the job must survive serialization
+    job = json.loads(json.dumps(job))
+    doc = HeadlessJsPDF(job['orientation'],'mm',job['format'])
+    page = 1
+    for op in job['ops']:
+      if op[0] == 'addPage':
+        if on_progress:
+          on_progress(page,job['pages'])
+        page += 1
+      getattr(doc,op[0])(*op[1:])
+    if on_progress:
+      on_progress(page,job['pages'])
+    output = doc.output('blob')
+  except Exception as e:
+    on_error(str(e))
+    return
+  on_done(output)
+
+
+def create_document(**page_setup):
+  '''returns a Document using the jspdf renderer on top of a HeadlessJsPDF'''
+  from . import Document
+  document = Document(js_doc=HeadlessJsPDF(),**page_setup)
+  document.doc.replay_ops = replay
+  document.doc.render_in_worker = render_in_worker
+  return document
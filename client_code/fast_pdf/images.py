@@ -0,0 +1,128 @@
+"""
+Content hash keyed image cache
+Images are decoded once per process (server) or page lifetime (client) and shared by every document
+"""
+
+
+def content_hash(data):
+  '''returns a stable key for the given image bytes'''
+  try:
+    import hashlib
+    return hashlib.sha1(data).hexdigest()
+  except ImportError:
+    #client runtimes without hashlib
+    return '%x%x' % (hash(data) & 0xffffffffffff,len(data))
+
+
+class ImageEntry:
+  def __init__(self,key,width,height,pil_image=None,base_64=None,size=0,byte_size=0):
+    self.key = key
+    self.width = width
+    self.height = height
+    #size of the encoded image file in bytes
+    self.byte_size = byte_size
+    #server: decoded PIL image, client: base64 representation for jspdf
+    self.pil_image = pil_image
+    self.base_64 = base_64
+    #approximate memory used by this entry in bytes
+    self.size = size
+
+
+class ImageRegistry:
+  def __init__(self,max_size=67108864):
+    '''max_size: approximate upper bound in bytes for all cached images, least recently used ones get evicted'''
+    self.max_size = max_size
+    self.entries = {}
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    #documents rendered in several threads share the registry
+    from .utils import create_lock
+    self.lock = create_lock()
+
+  def get(self,media,form='pil'):
+    '''
+    returns the cached ImageEntry for an anvil media object, decodes it on the first use
+    form: 'pil' (fpdf) or 'base_64' (jspdf) -> the representation that has to be available on the entry
+    '''
+    data = media.get_bytes()
+    key = content_hash(data)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.hits += 1
+      else:
+        self.misses += 1
+    #decoding happens outside of the lock, threads missing the same image at once decode it both
+    if entry is None:
+      entry = self._load(key,data,media)
+
+    if form == 'pil' and entry.pil_image is None:
+      self._add_pil_image(entry,data)
+    elif form == 'base_64' and entry.base_64 is None:
+      import base64
+      entry.base_64 = base64.b64encode(data).decode('utf-8')
+      self._add_size(entry,len(entry.base_64))
+
+    with self.lock:
+      #entries only count into the registry size while they are in it
+      previous = self.entries.pop(key,None)
+      if previous is not entry:
+        self.size += entry.size - (previous.size if previous is not None else 0)
+      self.entries[key] = entry
+      #the newest entry always stays even if it is larger than max_size
+      while self.size > self.max_size and len(self.entries) > 1:
+        oldest = self.entries.pop(next(iter(self.entries)))
+        self.size -= oldest.size
+        self.evictions += 1
+    return entry
+
+  def _load(self,key,data,media):
+    import anvil
+    entry = ImageEntry(key,0,0,byte_size=len(data))
+    self._add_size(entry,len(data))
+    if anvil.is_server_side():
+      #the decoded image is needed for the dimensions anyway
+      self._add_pil_image(entry,data)
+    else:
+      import anvil.image
+      entry.width,entry.height = anvil.image.get_dimensions(media)
+    return entry
+
+  def _add_pil_image(self,entry,data):
+    from PIL import Image
+    import io
+    image = Image.open(io.BytesIO(data))
+    #decoded completely before it is shared -> no lazy loading from several threads
+    image.load()
+    entry.pil_image = image
+    entry.width,entry.height = entry.pil_image.size
+    self._add_size(entry,entry.width * entry.height * len(entry.pil_image.getbands()))
+
+  def _add_size(self,entry,size):
+    with self.lock:
+      entry.size += size
+      if self.entries.get(entry.key) is entry:
+        self.size += size
+
+  def clear(self):
+    with self.lock:
+      self.entries = {}
+      self.size = 0
+
+  def get_stats(self):
+    '''returns hit/miss statistics as a dict'''
+    lookups = self.hits + self.misses
+    return {
+      'hits':self.hits,
+      'misses':self.misses,
+      'hit_rate':self.hits / lookups if lookups else 0,
+      'evictions':self.evictions,
+      'entries':len(self.entries),
+      'size':self.size,
+    }
+
+
+#shared by all documents
+registry = ImageRegistry()
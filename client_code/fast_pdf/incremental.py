@@ -0,0 +1,40 @@
+"""
+Appending pages to existing pdf files (server only)
+The new pages are written as a pdf incremental update: the original bytes are kept as they are and only
+the new objects, a new xref section and trailer are added at the end
+"""
+
+#pdf points per mm
+POINTS_PER_MM = 72 / 25.4
+
+
+def _get_pypdf():
+  try:
+    import pypdf
+  except ImportError:
+    raise ImportError('appending to existing pdf files requires pypdf -> add "pypdf" to your server requirements')
+  return pypdf
+
+
+def get_page_info(pdf_bytes):
+  '''returns (page_count,width,height) of an existing pdf, the size of the last page in mm'''
+  import io
+  pypdf = _get_pypdf()
+  reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+  page_count = len(reader.pages)
+  if not page_count:
+    return 0,None,None
+  box = reader.pages[-1].mediabox
+  return page_count,float(box.width) / POINTS_PER_MM,float(box.height) / POINTS_PER_MM
+
+
+def append_pages(pdf_bytes,addition):
+  '''returns pdf_bytes followed by an incremental update adding all pages of the pdf addition'''
+  import io
+  pypdf = _get_pypdf()
+  writer = pypdf.PdfWriter(io.BytesIO(pdf_bytes),incremental=True)
+  for page in pypdf.PdfReader(io.BytesIO(addition)).pages:
+    writer.add_page(page)
+  output = io.BytesIO()
+  writer.write(output)
+  return output.getvalue()
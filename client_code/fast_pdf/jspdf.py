@@ -1,7 +1,19 @@
-import anvil.js
+from . import fonts
+from . import measure
+from . import state
+
+#jspdf calls that change the state text measurement depends on -> also sent to the main thread document in worker mode
+MEASUREMENT_OPS = ('addFileToVFS','addFont','setFont','setFontSize')
+#text options of cells, shared by all calls -> jspdf only reads them
+TEXT_OPTIONS = {'L':{'align':'left'},'C':{'align':'center'},'R':{'align':'right'}}
+#fpdf rectangle styles -> D: draw, F: fill, DF: both
+RECT_STYLES = {'F':'F','DF':'FD','FD':'FD'}
 
 class jsPdf:
-  def __init__(self,parent):
+  #fpdf's default cell margin -> text is wrapped to the same width on both renderers
+  c_margin = 1
+
+  def __init__(self,parent,js_doc=None):
     #parent document
     self.parent = parent
     #Inherited Page layout
@@ -24,8 +36,46 @@ class jsPdf:
       self.page_height = parent.page_width
 
     #JS PDF Proxy Object
-    from anvil.js.window import jspdf
-    self.doc = jspdf.jsPDF(self.get_orientation(), 'mm',[self.page_width,self.page_height])
+    if js_doc is None:
+      from anvil.js.window import jspdf
+      if parent.output_profile is None:
+        js_doc = jspdf.jsPDF(self.get_orientation(), 'mm',[self.page_width,self.page_height])
+      else:
+        #stream compression is only available as a constructor option
+        js_doc = jspdf.jsPDF({'orientation':self.get_orientation(),'unit':'mm','format':[self.page_width,self.page_height],'compress':parent.output_profile.compress})
+    self.doc = js_doc
+
+    #Draw operations are recorded and replayed into jspdf in bulk when batching is enabled
+    self.ops = [] if parent.batch_ops else None
+    self.bridge_calls_saved = 0
+    #incremented by every jspdf call -> outputs of the same version are identical
+    self.version = 0
+    #function(doc,ops) replaying recorded operations, defaults to fastPdfReplay of the page
+    self.replay_ops = None
+    #Worker mode: the whole document is recorded and rendered by jspdf inside a web worker
+    self.worker_ops = [] if parent.worker else None
+    #function(job,on_progress,on_done,on_error), defaults to fastPdfRenderInWorker of the page
+    self.render_in_worker = None
+    #stream.PageChunker cutting the worker operations into page ranges -> start_stream()
+    self.page_stream = None
+
+    #static block draw function -> (recorded operations,cursor position,font,text color after drawing)
+    self.static_ops = {}
+    #true while draw_static records a block -> bulk operations go through _call one by one
+    self.recording_static = False
+    #image key -> size of its source file in bytes, bytes saved by downsampling -> get_size_report()
+    self.image_source_bytes = {}
+    self.image_bytes_saved = 0
+    #(image key,drawn size) -> images.ImageEntry of the downsampled image
+    self.downsampled_images = {}
+
+    #state sent to jspdf last -> unchanged fonts and colors are not sent again
+    self.sent_state = state.GraphicsState()
+
+    #(font_name,style) -> content hash of the font file added under that name
+    self.font_hashes = {}
+    #Text widths are measured in python from cached glyph widths
+    self.measurer = measure.TextMeasurer(self._get_unit_width,self.doc.internal.scaleFactor,glyphs=fonts.registry.glyphs,kerning=fonts.registry.kerning,font_hashes=self.font_hashes)
     
     #Cursor position
     self.current_x = 0
@@ -39,30 +89,26 @@ class jsPdf:
     self.current_font = None
     self.current_text_color = None
     self.page_number = 0
+    self.page_offset = 0
+    self.total_pages = None
 
   def get_orientation(self):
     return 'portrait' if self.orientation == 'P' else 'landscape'
 
   def header(self): 
     # get current font attributes
-    font_tuple = self.current_font
+    font = self.current_font
     text_color = self.current_text_color
     
     self._reset_x()
     self.current_y = self.margin_top
     self.header_callback(self)
-
-    #reset current font attributes
-    if font_tuple:
-      font_name,style,size = font_tuple
-      self.set_font(font_name,style,size)
-    if text_color:
-      self.set_text_color(*text_color)
+    self._restore_state(font,text_color)
 
 
   def footer(self):
     # get current font attributes
-    font_tuple = self.current_font
+    font = self.current_font
     text_color = self.current_text_color
     
     self._reset_x()
@@ -70,16 +116,19 @@ class jsPdf:
     self.auto_page_break = False
     self.footer_callback(self)
     self.auto_page_break = True
+    self._restore_state(font,text_color)
 
-    #reset current font attributes
-    if font_tuple:
-      font_name,style,size = font_tuple
-      self.set_font(font_name,style,size)
+  def _restore_state(self,font,text_color):
+    '''sets the font attributes from before a header, footer or static block, only changed ones reach jspdf'''
+    if font:
+      self.set_font(*font)
     if text_color:
       self.set_text_color(*text_color)
 
     
   def add_page(self,orientation='P',skip_header=False,skip_footer=False):
+    #replay the finished page before starting a new one
+    self.flush()
     self.page_number += 1
 
     self.orientation = orientation
@@ -87,24 +136,38 @@ class jsPdf:
     if self.first_page:
       self.first_page = False
     else:
-      self.doc.addPage([self.page_width,self.page_height],self.get_orientation())
+      self._call('addPage',[self.page_width,self.page_height],self.get_orientation())
+      self.sent_state.reset_page()
+      if self.page_stream is not None:
+        #the previous page is finished -> its range may be complete
+        self.page_stream.feed(self.worker_ops)
       
-    if not skip_footer: self.footer()
+    if not skip_footer and self.footer_callback: self.footer()
     self._reset_y()
-    if not skip_header: self.header()
+    if not skip_header and self.header_callback: self.header()
     self._reset_x()
     
   def will_page_break(self,height):
     return self.current_y + height + self.margin_bottom + self.footer_height >= self.page_height
 
   def add_font(self,file_name,font_name,base_64_font,font_style=''):
-    self.doc.addFileToVFS(file_name, base_64_font)
-    self.doc.addFont(file_name, font_name, font_style)
+    base_64_font = fonts.registry.get_base_64(file_name,base_64_font)
+    self.font_hashes[(font_name,font_style)] = fonts.registry.base_64_hashes[file_name]
+    self._call('addFileToVFS',file_name, base_64_font)
+    self._call('addFont',file_name, font_name, font_style)
     
   def set_font(self,font_name,style='',size=10):
+    state = self.sent_state
+    if font_name != state.font_name or style != state.font_style:
+      self._call('setFont',font_name,style)
+      state.font_name = font_name
+      state.font_style = style
+    elif size == state.font_size:
+      return
+    if size != state.font_size:
+      self._call('setFontSize',size)
+      state.font_size = size
     self.current_font = (font_name,style,size)
-    self.doc.setFont(font_name,style)
-    self.doc.setFontSize(size)
 
   def _check_new_page(self,offset):
     if self.auto_page_break and self.current_y + offset + self.margin_bottom + self.footer_height >= self.page_height: 
@@ -118,6 +181,136 @@ class jsPdf:
 
   def _get_font(self):
     return self.current_font
+
+  def _call(self,method,*args):
+    '''calls a jspdf method directly or records it when batching is enabled'''
+    self.version += 1
+    if self.worker_ops is not None:
+      op = [method]
+      op.extend(args)
+      self.worker_ops.append(op)
+      if method not in MEASUREMENT_OPS:
+        return
+    if self.ops is None:
+      getattr(self.doc,method)(*args)
+    else:
+      op = [method]
+      op.extend(args)
+      self.ops.append(op)
+
+  def _call_many(self,ops):
+    '''calls a list of recorded jspdf operations, with a single bridge call unless they are recorded anyway'''
+    if self.ops is not None or self.worker_ops is not None or self.recording_static:
+      for op in ops:
+        self._call(*op)
+      return
+    self.version += 1
+    if self.replay_ops is None:
+      from anvil.js.window import fastPdfReplay
+      self.replay_ops = fastPdfReplay
+    self.replay_ops(self.doc,ops)
+    self.bridge_calls_saved += len(ops) - 1
+
+  def draw_static(self,draw):
+    '''draws draw(self) once while recording its operations and replays them on every later call'''
+    font,text_color = self.current_font,self.current_text_color
+    entry = self.static_ops.get(draw)
+    if entry is None:
+      ops = []
+      call = self._call
+      def record(method,*args):
+        ops.append([method] + list(args))
+        call(method,*args)
+      #the recording must contain every state change of the block -> nothing is skipped as redundant
+      self.sent_state.reset()
+      recording_static = self.recording_static
+      self._call = record
+      self.recording_static = True
+      try:
+        draw(self)
+      finally:
+        self._call = call
+        self.recording_static = recording_static
+      methods = set(op[0] for op in ops)
+      end_font = self.current_font if 'setFont' in methods else None
+      end_text_color = self.current_text_color if 'setTextColor' in methods else None
+      entry = self.static_ops[draw] = (ops,self.current_x,self.current_y,end_font,end_text_color)
+    else:
+      self._call_many(entry[0])
+    ops,self.current_x,self.current_y,end_font,end_text_color = entry
+
+    #jspdf is in the state the block left it in, continue with the state from before the block
+    state = self.sent_state
+    state.reset_page()
+    if end_font:
+      self.current_font = end_font
+      state.font_name,state.font_style,state.font_size = end_font
+    if end_text_color:
+      self.current_text_color = state.text_color = end_text_color
+    self._restore_state(font,text_color)
+
+  def flush(self):
+    '''replays all recorded draw operations into jspdf with a single bridge call'''
+    if not self.ops:
+      return
+    if self.replay_ops is None:
+      from anvil.js.window import fastPdfReplay
+      self.replay_ops = fastPdfReplay
+    self.replay_ops(self.doc,self.ops)
+    self.bridge_calls_saved += len(self.ops) - 1
+    self.ops = []
+
+  def get_worker_job(self):
+    '''returns the recorded document as a structured-clonable dict for the worker'''
+    return {
+      'orientation':self.get_orientation(),
+      'format':[self.page_width,self.page_height],
+      'pages':self.page_number,
+      'ops':self.worker_ops,
+    }
+
+  def render_async(self,on_done,on_progress=None,on_error=None,job=None):
+    '''renders the recorded document (or a page range job) in a web worker, on_done receives the jspdf output blob'''
+    if self.render_in_worker is None:
+      from anvil.js.window import fastPdfRenderInWorker
+      self.render_in_worker = fastPdfRenderInWorker
+    self.render_in_worker(job or self.get_worker_job(),on_progress,on_done,on_error)
+
+  def start_stream(self,on_job,chunk_pages):
+    '''sends the recorded pages in jobs of chunk_pages pages to on_job(job), later ranges as soon as they are drawn'''
+    from . import stream
+    self.page_stream = stream.PageChunker(on_job,chunk_pages,self.get_orientation(),[self.page_width,self.page_height])
+    self.page_stream.feed(self.worker_ops)
+
+  def end_stream(self):
+    '''sends the last page range'''
+    page_stream,self.page_stream = self.page_stream,None
+    page_stream.finish(self.worker_ops)
+
+  def replay_worker_ops(self):
+    '''draws the recorded document into the main thread jspdf instead, later calls are drawn directly'''
+    self.flush()
+    #start from the jspdf default font like the worker document
+    ops = [['setFont','helvetica','normal'],['setFontSize',16]] + self.worker_ops
+    self.worker_ops = None
+    if self.replay_ops is None:
+      from anvil.js.window import fastPdfReplay
+      self.replay_ops = fastPdfReplay
+    self.replay_ops(self.doc,ops)
+
+  def _get_unit_width(self,text):
+    #measurements depend on the font state -> pending operations must reach jspdf first
+    self.flush()
+    return self.doc.getStringUnitWidth(text)
+
+  def get_string_width(self,text):
+    return self._get_text_width(text)
+
+  def _get_text_width(self,text):
+    if self.current_font is None:
+      self.flush()
+      return self.doc.getTextDimensions(text).get('w')
+    return self.measurer.get_string_width(text,self.current_font)
     
 
   def vertical_text(self,width,height,text,border = 0, ln = 1, align='L', fill=False):
@@ -125,14 +318,14 @@ class jsPdf:
     self._check_new_page(height)
     
     if fill:
-      rect_height = self.doc.getTextDimensions(text).get('w') + 2
-      add_height = self.doc.getTextDimensions(text).get('w') + 1
-      self.doc.rect(self.current_x, self.current_y - add_height, height, rect_height, 'F')
+      rect_height = self._get_text_width(text) + 2
+      add_height = self._get_text_width(text) + 1
+      self._call('rect',self.current_x, self.current_y - add_height, height, rect_height, 'F')
       
     font_name,style,font_size = self._get_font()
     add_width = (height/2 + font_size * 0.106)
       
-    self.doc.text(text,self.current_x + add_width, self.current_y, {'angle':90})
+    self._call('text',text,self.current_x + add_width, self.current_y, {'angle':90})
                   
     self.current_x += width
     if ln==1: 
@@ -144,17 +337,17 @@ class jsPdf:
     if check_new_page: self._check_new_page(height)
 
     if fill:
-      self.doc.rect(self.current_x, self.current_y, width, height, 'F')
+      self._call('rect',self.current_x, self.current_y, width, height, 'F')
 
     font_name,style,font_size = self._get_font()
     add_height = (height/2 + font_size * 0.106) if isinstance(height,(int,float)) and isinstance(font_size,(int,float)) else 4
 
     if align == 'C':
-      self.doc.text(text,self.current_x + width/2, self.current_y+add_height,{'align':'center'})
+      self._call('text',text,self.current_x + width/2, self.current_y+add_height,TEXT_OPTIONS['C'])
     elif align == 'R':
-      self.doc.text(text + ' ',self.current_x + width, self.current_y+add_height,{'align':'right'})
+      self._call('text',text + ' ',self.current_x + width, self.current_y+add_height,TEXT_OPTIONS['R'])
     else:
-      self.doc.text(text,self.current_x, self.current_y+add_height,{'align':'left'})
+      self._call('text',text,self.current_x, self.current_y+add_height,TEXT_OPTIONS['L'])
 
     self.current_x += width
     if ln==1: 
@@ -163,70 +356,93 @@ class jsPdf:
 
       
 
-  def multi_cell(self,width,height,text,border = 0, ln = 1, align='L'):
+  def multi_cell(self,width,height,text,border = 0, ln = 1, align='L', mode='greedy', hyphenate=None):
     if not text: return
-    # splits the text into parts
+    from . import wrap
+    lines = wrap.wrap_text(text,width - 2 * self.c_margin,self._get_text_width,mode,hyphenate)
+    self.draw_lines(width,height,lines,border=border,ln=ln,align=align)
+
+  def draw_lines(self,width,height,lines,border = 0, ln = 1, align='L'):
+    '''draws already wrapped lines below each other'''
     current_x = self.current_x
-    lines_list = text.splitlines()
-
-    for line in lines_list:
-      words_list = line.split(' ')
-      current_row_text = ''
-      for word in words_list:
-        # in new lines when text is longer that actual cell -> shorten text until it fits and redo it until whole word is done
-        if not current_row_text and self.doc.getTextDimensions(word).get('w') > width:
-          current_row_text = word
-          while self.doc.getTextDimensions(current_row_text).get('w') > width: # loop over and cut last character of word
-            current_row_text = current_row_text[:-1]
-            if self.doc.getTextDimensions(current_row_text).get('w') <= width: # if word fits -> make cell and set remaining word - if it is shorter than cell -> continue, if it is larger -> redo cycle
-              self.cell(width,height,current_row_text,border=border,ln=1)
-              self.current_x = current_x
-              word = word[len(current_row_text):]
-              current_row_text = word
-          current_row_text += ' '
-          continue
-  
-        # if text plus word is larger than cell -> append cell and start new row
-        if self.doc.getTextDimensions(current_row_text + word).get('w') >= width:
-          self.cell(width,height,current_row_text,border=border,ln=1)
-          self.current_x = current_x
-          current_row_text = ''
-          
-        current_row_text += word + ' '
-  
-      # in the end if there is still a text to append
-      if current_row_text:
-        self.cell(width,height,current_row_text,border=border,ln=1)
-        self.current_x = current_x
+    for line in lines:
+      self.cell(width,height,line,border=border,ln=1,align=align)
+      self.current_x = current_x
 
     self._reset_x()
       
 
   def line(self,x_start,y_start,x_end,y_end):
-    self.doc.line(x_start,y_start,x_end,y_end)
+    self._call('line',x_start,y_start,x_end,y_end)
+
+  def rect(self,x,y,w,h,style=None):
+    self._call('rect',x,y,w,h,RECT_STYLES.get(style,'S'))
+
+  def lines(self,rows):
+    '''draws rows of (x_start,y_start,x_end,y_end) with a single bridge call'''
+    if rows:
+      self._call_many([['line',x1,y1,x2,y2] for x1,y1,x2,y2 in rows])
+
+  def rects(self,rows,style='D'):
+    '''draws rows of (x,y,w,h) with a single bridge call'''
+    if rows:
+      style = RECT_STYLES.get(style,'S')
+      self._call_many([['rect',x,y,w,h,style] for x,y,w,h in rows])
+
+  def cells(self,xs,ys,widths,texts,height,align='L',fill=False):
+    '''draws single line cells at absolute positions with a single bridge call, fill rectangles below all texts'''
+    font_name,style,font_size = self._get_font()
+    add_height = (height/2 + font_size * 0.106) if isinstance(height,(int,float)) and isinstance(font_size,(int,float)) else 4
+    ops = [['rect',x,y,w,height,'F'] for x,y,w in zip(xs,ys,widths)] if fill else []
+    options = TEXT_OPTIONS[align if align in ('C','R') else 'L']
+    for x,y,w,text in zip(xs,ys,widths,texts):
+      if not text:
+        continue
+      if align == 'C':
+        ops.append(['text',text,x + w/2,y + add_height,options])
+      elif align == 'R':
+        ops.append(['text',text + ' ',x + w,y + add_height,options])
+      else:
+        ops.append(['text',text,x,y + add_height,options])
+    if ops:
+      self._call_many(ops)
 
   def set_text_color(self,color_1,color_2=None,color_3=None):
+    color = (color_1,color_2,color_3)
+    if color == self.sent_state.text_color:
+      return
     if color_2 != None and color_3 != None:
-      self.doc.setTextColor(color_1,color_2,color_3)
+      self._call('setTextColor',color_1,color_2,color_3)
     else:
-      self.doc.setTextColor(color_1)
+      self._call('setTextColor',color_1)
 
-    self.current_text_color = (color_1,color_2,color_3)
+    self.current_text_color = self.sent_state.text_color = color
 
   def set_draw_color(self,color_1,color_2=None,color_3=None):
+    color = (color_1,color_2,color_3)
+    if color == self.sent_state.draw_color:
+      return
     if color_2 != None and color_3 != None:
-      self.doc.setDrawColor(color_1,color_2,color_3)
+      self._call('setDrawColor',color_1,color_2,color_3)
     else:
-      self.doc.setDrawColor(color_1)
+      self._call('setDrawColor',color_1)
+    self.sent_state.draw_color = color
 
   def set_fill_color(self,color_1,color_2=None,color_3=None):
+    color = (color_1,color_2,color_3)
+    if color == self.sent_state.fill_color:
+      return
     if color_2 != None and color_3 != None:
-      self.doc.setFillColor(color_1,color_2,color_3)
+      self._call('setFillColor',color_1,color_2,color_3)
     else:
-      self.doc.setFillColor(color_1)
+      self._call('setFillColor',color_1)
+    self.sent_state.fill_color = color
 
   def set_line_width(self,line_width):
-    self.doc.setLineWidth(line_width)
+    if line_width == self.sent_state.line_width:
+      return
+    self._call('setLineWidth',line_width)
+    self.sent_state.line_width = line_width
 
   def get_x(self):
     return self.current_x
@@ -235,29 +451,51 @@ class jsPdf:
     return self.current_y
 
   def rotate(self,angle):
-    self.doc.rotate(angle)
+    self._call('rotate',angle)
     
   def doc(self,width, height, text):
     self.doc.text(text,height,width)
 
   def add_image(self,image_data,x=0,y=0,w=0,h=0,alias='',compression='FAST',rotation=0,keep_aspect_ratio=True):
     '''Takes an image in form of a blob and prints it on the pdf'''
-    from . import utils
+    from . import images
+    entry = images.registry.get(image_data,'base_64')
     if keep_aspect_ratio:
-      d_width,d_height = utils.get_image_dimenstions(image_data)
-      image_ar = d_width/d_height
+      image_ar = entry.width/entry.height
       pdf_ar = w/h
       if image_ar < pdf_ar:
         #adjust height
         w = h * image_ar
       elif image_ar > pdf_ar:
         h = w / image_ar
-        
-    base_64_image = utils.media_obj_to_base64(image_data)
-    self.doc.addImage(base_64_image,'JPEG',x,y,w,h,alias,compression,rotation)
+
+    profile = self.parent.output_profile
+    if profile is not None and profile.image_dpi:
+      entry = self._get_downsampled_image(image_data,entry,w,h,profile)
+    elif entry.key not in self.image_source_bytes:
+      self.image_source_bytes[entry.key] = entry.byte_size
+
+    #jspdf embeds each alias once and references it afterwards
+    self._call('addImage',entry.base_64,'JPEG',x,y,w,h,alias or entry.key,compression,rotation)
+
+  def _get_downsampled_image(self,image_data,entry,w,h,profile):
+    '''returns the registry entry of the image resized to its drawn size'''
+    from . import images
+    from . import optimize
+    size = optimize.get_target_size(w,h,profile.image_dpi)
+    small = self.downsampled_images.get((entry.key,size))
+    if small is not None:
+      return small
+    media = optimize.downsample_media(image_data,entry.width,entry.height,w,h,profile)
+    small = entry if media is None else images.registry.get(media,'base_64')
+    self.downsampled_images[(entry.key,size)] = small
+    if small.key not in self.image_source_bytes:
+      self.image_source_bytes[small.key] = entry.byte_size
+      self.image_bytes_saved += entry.byte_size - small.byte_size
+    return small
 
   def page_no(self):
-    return self.page_number
+    return self.page_number + self.page_offset
 
   def set_y(self,value):
     if value <= 0:
@@ -0,0 +1,244 @@
+"""
+Two pass layout: measure then paint
+The layout pass computes all page breaks and positions from box heights without touching jspdf/fpdf
+The paint pass adds the pages and draws every box at its computed position
+A layout can be painted again (also into a new document with the same page setup) with different data
+"""
+
+
+class Box:
+  def __init__(self,height=0,keep_with_next=False,page_break_before=False):
+    self.height = height
+    #keep this box on the same page as the following one
+    self.keep_with_next = keep_with_next
+    self.page_break_before = page_break_before
+
+  def paint(self,document,placement,data):
+    pass
+
+
+class Spacer(Box):
+  pass
+
+
+class Block(Box):
+  def __init__(self,height,draw,keep_with_next=False,page_break_before=False):
+    '''draw: callable(document,data) that draws the block starting at the current cursor position'''
+    super().__init__(height,keep_with_next,page_break_before)
+    self.draw = draw
+
+  def paint(self,document,placement,data):
+    self.draw(document,data)
+
+
+class Paragraph(Box):
+  def __init__(self,lines,width,line_height,align='L',min_lines=2,keep_with_next=False,page_break_before=False):
+    '''
+    A list of already wrapped lines that may be split across pages
+    min_lines: minimum number of lines left at the end or carried to the start of a page (widow/orphan control)
+    '''
+    super().__init__(len(lines) * line_height,keep_with_next,page_break_before)
+    self.lines = lines
+    self.width = width
+    self.line_height = line_height
+    self.align = align
+    self.min_lines = min_lines
+
+  @classmethod
+  def from_text(cls,document,text,width,line_height,**kwargs):
+    '''wraps text with the current font of document'''
+    from . import wrap
+    return cls(wrap.wrap_text(text,width,document.get_string_width),width,line_height,**kwargs)
+
+  def paint(self,document,placement,data):
+    x = document.get_x()
+    for line in self.lines[placement.start:placement.end]:
+      document.set_x(x)
+      document.cell(self.width,self.line_height,line,ln=1,align=self.align,check_new_page=False)
+
+
+class Group(Box):
+  def __init__(self,children,keep_together=True,keep_with_next=False,page_break_before=False):
+    '''children are kept on one page if keep_together is set and the group fits on a page'''
+    super().__init__(sum(child.height for child in children),keep_with_next,page_break_before)
+    self.children = children
+    self.keep_together = keep_together
+
+  def paint(self,document,placement,data):
+    x,y = document.get_x(),placement.y
+    for child in self.children:
+      document.set_xy(x,y)
+      child.paint(document,Placement(child,y,0,len(getattr(child,'lines',()))),data)
+      y += child.height
+
+
+class BoxBuilder:
+  '''
+  Builds boxes from the same calls that would draw the content directly into a Document
+  Cells up to the next line break form one Block, multi_cell becomes a Paragraph that may split across pages
+  Font and color calls are applied to the document right away (text is measured with them) and replayed when painting
+  '''
+  STATE_METHODS = ('set_font','set_text_color','set_draw_color','set_fill_color','set_line_width')
+
+  def __init__(self,document):
+    self.document = document
+    self.boxes = []
+    #calls of the current line -> (method name,args,kwargs)
+    self.calls = []
+    self.line_height = 0
+    self.page_break_before = False
+
+  def __getattr__(self,name):
+    if name not in BoxBuilder.STATE_METHODS:
+      raise AttributeError(f"BoxBuilder does not support {name}(), use block() to draw it")
+    def call(*args,**kwargs):
+      getattr(self.document,name)(*args,**kwargs)
+      self.calls.append((name,args,kwargs))
+    return call
+
+  def cell(self,width,height,text,border=0,ln=0,align='L',fill=False):
+    self.calls.append(('cell',(width,height,text),{'border':border,'ln':ln,'align':align,'fill':fill,'check_new_page':False}))
+    self.line_height = max(self.line_height,height)
+    if ln == 1:
+      self._end_line(self.line_height)
+
+  def new_line(self,height):
+    self._end_line(height)
+
+  def spacer(self,height):
+    self._end_line(self.line_height)
+    self._add(Spacer(height))
+
+  def multi_cell(self,width,height,text,align='L',mode='greedy',hyphenate=None,min_lines=2):
+    '''wrapped like Document.multi_cell, the lines are split across pages with widow/orphan control'''
+    from . import wrap
+    self._end_line(self.line_height)
+    lines = wrap.wrap_text(text,width - 2 * self.document.doc.c_margin,self.document.get_string_width,mode,hyphenate)
+    self._add(Paragraph(lines,width,height,align=align,min_lines=min_lines))
+
+  def block(self,height,draw,keep_with_next=False):
+    '''adds a Block for anything else, draw: callable(document,data)'''
+    self._end_line(self.line_height)
+    self._add(Block(height,draw,keep_with_next=keep_with_next))
+
+  def page_break(self):
+    '''the next box starts on a new page'''
+    self._end_line(self.line_height)
+    self.page_break_before = True
+
+  def get_boxes(self):
+    '''returns the boxes of all calls so far, pass them to Document.layout()'''
+    self._end_line(self.line_height)
+    return self.boxes
+
+  def _end_line(self,height):
+    if self.calls or height:
+      calls = self.calls
+      def draw(document,data):
+        for name,args,kwargs in calls:
+          getattr(document,name)(*args,**kwargs)
+      self._add(Block(height,draw))
+    self.calls = []
+    self.line_height = 0
+
+  def _add(self,box):
+    box.page_break_before = self.page_break_before
+    self.page_break_before = False
+    self.boxes.append(box)
+
+
+class Placement:
+  def __init__(self,box,y,start=0,end=0):
+    self.box = box
+    self.y = y
+    #line range of split paragraphs
+    self.start = start
+    self.end = end
+
+
+class Layout:
+  def __init__(self,pages,top,bottom):
+    #list of pages -> each page is a list of placements
+    self.pages = pages
+    self.top = top
+    self.bottom = bottom
+
+  @property
+  def page_count(self):
+    return len(self.pages)
+
+  def paint(self,document,data=None):
+    '''adds the pages to document and draws all boxes, data is passed on to every Block.draw'''
+    document.doc.total_pages = self.page_count
+    for placements in self.pages:
+      document.add_page(orientation=document.orientation)
+      for placement in placements:
+        document.set_xy(document.margin_left,placement.y)
+        placement.box.paint(document,placement,data)
+
+
+def compute_layout(document,boxes):
+  '''returns the Layout of boxes for the page setup of document'''
+  top = document.margin_top + document.header_height
+  bottom = document.get_page_height() - document.margin_bottom - document.footer_height
+  page_height = bottom - top
+
+  pages = [[]]
+  y = top
+  items = list(boxes)
+  index = 0
+  while index < len(items):
+    box = items[index]
+
+    if box.page_break_before and pages[-1]:
+      pages.append([])
+      y = top
+
+    #boxes chained with keep_with_next move to the next page together
+    chain_height = box.height
+    chain_index = index
+    while items[chain_index].keep_with_next and chain_index + 1 < len(items):
+      chain_index += 1
+      chain_height += items[chain_index].height
+    if chain_index > index and y + chain_height > bottom and y > top and chain_height <= page_height:
+      pages.append([])
+      y = top
+
+    if isinstance(box,Group) and (not box.keep_together or box.height > page_height) and y + box.height > bottom:
+      #the group can not be kept together -> flow its children
+      items[index:index+1] = box.children
+      continue
+
+    if isinstance(box,Paragraph) and y + box.height > bottom:
+      start = 0
+      while start < len(box.lines):
+        fitting = int((bottom - y) // box.line_height)
+        remaining = len(box.lines) - start
+        if fitting >= remaining:
+          fitting = remaining
+        elif remaining - fitting < box.min_lines:
+          #widow control: carry enough lines to the next page
+          fitting = remaining - box.min_lines
+        if fitting < min(box.min_lines,remaining) and y > top:
+          #orphan control: do not start the paragraph with too few lines
+          fitting = 0
+        if fitting <= 0 and y == top:
+          fitting = min(remaining,max(1,int(page_height // box.line_height)))
+        if fitting > 0:
+          pages[-1].append(Placement(box,y,start,start + fitting))
+          y += fitting * box.line_height
+          start += fitting
+        if start < len(box.lines):
+          pages.append([])
+          y = top
+      index += 1
+      continue
+
+    if y + box.height > bottom and y > top:
+      pages.append([])
+      y = top
+    pages[-1].append(Placement(box,y,0,len(getattr(box,'lines',()))))
+    y += box.height
+    index += 1
+
+  return Layout(pages,top,bottom)
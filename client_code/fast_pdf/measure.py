@@ -0,0 +1,76 @@
+"""
+Text measurement helpers
+Widths are built from cached glyph advances and pair kerning per font, so a row of text
+can be measured in python instead of asking the renderer for every single string
+"""
+
+
+class TextMeasurer:
+  def __init__(self,unit_width_function,scale_factor,max_entries=4096,glyphs=None,kerning=None,font_hashes=None):
+    '''
+    Args:
+      unit_width_function: returns the width of a string for the active font in units of the font size
+      scale_factor: points per document unit (e.g. 72/25.4 for mm)
+      max_entries: maximum number of measured strings kept in the lru cache
+      glyphs,kerning: optional width tables to share between measurers of the same fonts
+      font_hashes: optional (font_name,style) -> content hash of the font file, keeps the shared tables of
+                   different files registered under the same name apart
+    '''
+    self.unit_width_function = unit_width_function
+    self.scale_factor = scale_factor
+    self.max_entries = max_entries
+
+    #(font_name,style,content hash) -> {char: advance width}
+    self.glyphs = {} if glyphs is None else glyphs
+    #(font_name,style,content hash) -> {char pair: kerning adjustment}
+    self.kerning = {} if kerning is None else kerning
+    #(font_name,style) -> content hash, fonts without an entry (e.g. standard fonts) use None
+    self.font_hashes = {} if font_hashes is None else font_hashes
+    #(font_name,style,size,text) -> width in document units (insertion ordered -> lru)
+    self.widths = {}
+
+    self.hits = 0
+    self.misses = 0
+
+  def get_string_width(self,text,font):
+    '''returns the width of text in document units, font is a tuple -> (font_name,style,size)'''
+    font_name,style,size = font
+    key = (font_name,style,size,text)
+    widths = self.widths
+    if key in widths:
+      self.hits += 1
+      width = widths.pop(key)
+      widths[key] = width
+      return width
+
+    self.misses += 1
+    width = self.get_unit_width(text,font) * size / self.scale_factor
+    widths[key] = width
+    if len(widths) > self.max_entries:
+      del widths[next(iter(widths))]
+    return width
+
+  def get_unit_width(self,text,font):
+    '''returns the width of text in units of the font size, summed up from glyph advances and kerning'''
+    font_key = (font[0],font[1],self.font_hashes.get((font[0],font[1])))
+    glyphs = self.glyphs.get(font_key)
+    if glyphs is None:
+      glyphs = self.glyphs[font_key] = {}
+      self.kerning[font_key] = {}
+    kerning = self.kerning[font_key]
+
+    width = 0
+    prior = None
+    for char in text:
+      advance = glyphs.get(char)
+      if advance is None:
+        advance = glyphs[char] = self.unit_width_function(char)
+      width += advance
+      if prior is not None:
+        pair = prior + char
+        adjustment = kerning.get(pair)
+        if adjustment is None:
+          adjustment = kerning[pair] = self.unit_width_function(pair) - glyphs[prior] - advance
+        width += adjustment
+      prior = char
+    return width
@@ -0,0 +1,244 @@
+"""
+Output size settings (Document(output_profile=OutputProfile(...))) and the size report of Document.get_size_report()
+
+Server: deflate level of all streams, images downsampled and recompressed to the drawn size,
+        optional rewrite into compressed object streams with a cross-reference stream (pdf 1.5, requires pypdf)
+        fonts are always subset by fpdf2
+Client: jspdf stream compression, images downsampled to the drawn size with anvil.image
+"""
+
+MM_PER_INCH = 25.4
+
+
+class OutputProfile:
+  def __init__(self,compression_level=None,object_streams=False,image_dpi=None,image_quality=85,compress=True):
+    '''
+    compression_level: zlib level 0-9 for content, font and image streams (server), None keeps the default
+    object_streams: server only, packs all non-stream objects into compressed object streams
+    image_dpi: images with a higher resolution at their drawn size are downsampled to it, None keeps them
+    image_quality: jpeg quality of downsampled images without transparency
+    compress: stream compression at all (jspdf compresses nothing by default)
+    '''
+    self.compression_level = compression_level
+    self.object_streams = object_streams
+    self.image_dpi = image_dpi
+    self.image_quality = image_quality
+    self.compress = compress
+
+
+def get_target_size(width,height,dpi):
+  '''returns the pixel size of an image drawn with width x height mm at dpi'''
+  return max(1,round(width / MM_PER_INCH * dpi)),max(1,round(height / MM_PER_INCH * dpi))
+
+
+def downsample(pil_image,width,height,profile):
+  '''
+  returns the image resized to the drawn size (BytesIO with a jpeg or a PIL image for transparent images)
+  or None if its resolution does not exceed profile.image_dpi
+  '''
+  target_width,target_height = get_target_size(width,height,profile.image_dpi)
+  if pil_image.width <= target_width and pil_image.height <= target_height:
+    return None
+  from PIL import Image
+  import io
+  image = pil_image.resize((min(pil_image.width,target_width),min(pil_image.height,target_height)),Image.LANCZOS)
+  if image.mode in ('RGBA','LA','PA') or 'transparency' in image.info:
+    return image
+  buffer = io.BytesIO()
+  image.convert('L' if image.mode in ('1','L') else 'RGB').save(buffer,'JPEG',quality=profile.image_quality,optimize=True)
+  buffer.seek(0)
+  return buffer
+
+
+def downsample_media(media,image_width,image_height,width,height,profile):
+  '''
+  returns the media object resized to the drawn size or None if its resolution does not exceed profile.image_dpi
+  image_width,image_height: pixel size of the image
+  '''
+  import anvil
+  target_width,target_height = get_target_size(width,height,profile.image_dpi)
+  if image_width <= target_width and image_height <= target_height:
+    return None
+  if not anvil.is_server_side():
+    import anvil.image
+    #keeps the aspect ratio, max_size limits the longer side
+    return anvil.image.generate_thumbnail(media,max(target_width,target_height))
+  #headless documents outside of the browser
+  from PIL import Image
+  import io
+  image = downsample(Image.open(io.BytesIO(media.get_bytes())),width,height,profile)
+  if isinstance(image,io.BytesIO):
+    return anvil.BlobMedia('image/jpeg',image.getvalue())
+  buffer = io.BytesIO()
+  image.save(buffer,'PNG')
+  return anvil.BlobMedia('image/png',buffer.getvalue())
+
+
+def write_object_streams(pdf_bytes,compression_level=None,objects_per_stream=200):
+  '''
+  returns pdf_bytes rewritten with all non-stream objects in compressed object streams and a cross-reference stream
+  '''
+  import io
+  import struct
+  import zlib
+  pypdf = _get_pypdf()
+  from pypdf.generic import StreamObject
+
+  level = -1 if compression_level is None else compression_level
+  reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+  trailer = reader.trailer
+  size = int(trailer['/Size'])
+
+  def serialize(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer)
+    return buffer.getvalue()
+
+  #object and cross-reference streams need pdf 1.5, newer versions of the source are kept
+  version = reader.pdf_header[len('%PDF-'):]
+  if tuple(int(part) for part in version.split('.')) < (1,5):
+    version = '1.5'
+  output = io.BytesIO()
+  output.write(b'%PDF-' + version.encode() + b'\n%\xe2\xe3\xcf\xd3\n')
+  #object number -> (1,offset) for objects in the file, (2,stream number,index) for compressed ones
+  entries = {}
+  compressed = []
+  for number in range(1,size):
+    obj = reader.get_object(number)
+    if obj is None:
+      continue
+    if isinstance(obj,StreamObject):
+      entries[number] = (1,output.tell(),0)
+      output.write(b'%d 0 obj\n' % number + serialize(obj) + b'\nendobj\n')
+    else:
+      compressed.append((number,serialize(obj)))
+
+  next_number = size
+  for start in range(0,len(compressed),objects_per_stream):
+    chunk = compressed[start:start + objects_per_stream]
+    offsets,bodies,position = [],[],0
+    for index,(number,data) in enumerate(chunk):
+      offsets.append(b'%d %d' % (number,position))
+      bodies.append(data)
+      position += len(data) + 1
+      entries[number] = (2,next_number,index)
+    header = b' '.join(offsets) + b'\n'
+    data = zlib.compress(header + b'\n'.join(bodies) + b'\n',level)
+    entries[next_number] = (1,output.tell(),0)
+    output.write(b'%d 0 obj\n<</Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d>>\nstream\n' % (next_number,len(chunk),len(header),len(data)))
+    output.write(data + b'\nendstream\nendobj\n')
+    next_number += 1
+
+  xref_number = next_number
+  entries[xref_number] = (1,output.tell(),0)
+  rows = [struct.pack('>BIH',0,0,65535)]
+  for number in range(1,xref_number + 1):
+    rows.append(struct.pack('>BIH',*entries.get(number,(0,0,0))))
+  data = zlib.compress(b''.join(rows),level)
+  extra = b''
+  for key in ('/Root','/Info'):
+    if key in trailer:
+      extra += b' %s %d 0 R' % (key.encode(),trailer.raw_get(key).idnum)
+  if '/ID' in trailer:
+    extra += b' /ID ' + serialize(trailer['/ID'])
+  output.write(b'%d 0 obj\n<</Type /XRef /Size %d /W [1 4 2] /Filter /FlateDecode /Length %d%s>>\nstream\n' % (xref_number,xref_number + 1,len(data),extra))
+  output.write(data + b'\nendstream\nendobj\n')
+  output.write(b'startxref\n%d\n%%%%EOF\n' % entries[xref_number][1])
+  return output.getvalue()
+
+
+def _get_pypdf():
+  try:
+    import pypdf
+  except ImportError:
+    raise ImportError('object streams and size reports require pypdf -> add "pypdf" to your server requirements')
+  return pypdf
+
+
+def _get_category(obj):
+  subtype = obj.get('/Subtype')
+  if subtype == '/Image':
+    return 'images'
+  if '/Length1' in obj or subtype in ('/Type1C','/CIDFontType0C','/OpenType'):
+    return 'fonts'
+  if obj.get('/Type') in ('/XRef','/ObjStm','/Metadata') or subtype == '/XML':
+    return 'structure'
+  return 'content'
+
+
+#fpdf trace label of a stream (fpdf.STREAM_LABELS) -> category
+LABEL_CATEGORIES = {'pages':'content','fonts':'fonts','images':'images'}
+
+
+def _get_labeled_category(obj,label):
+  #fpdf writes form xobjects (static blocks) with the images
+  if label is None or obj.get('/Subtype') == '/Form':
+    return _get_category(obj)
+  return LABEL_CATEGORIES[label]
+
+
+def analyze_pdf(pdf_bytes,stream_labels=None):
+  '''
+  returns {category: {'bytes':stored stream bytes,'decoded_bytes':...}} for content, images, fonts and structure
+  stream_labels: object number -> fpdf trace label of the streams, streams without a label are categorized by their type
+  '''
+  import io
+  pypdf = _get_pypdf()
+  from pypdf.generic import StreamObject
+  reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+  categories = {name:{'bytes':0,'decoded_bytes':0} for name in ('content','images','fonts','structure')}
+  for number in range(1,int(reader.trailer['/Size'])):
+    try:
+      obj = reader.get_object(number)
+    except Exception:
+      continue
+    if not isinstance(obj,StreamObject):
+      continue
+    category = categories[_get_labeled_category(obj,(stream_labels or {}).get(number))]
+    category['bytes'] += len(obj._data)
+    try:
+      category['decoded_bytes'] += len(obj.get_data())
+    except Exception:
+      category['decoded_bytes'] += len(obj._data)
+  return categories
+
+
+def get_size_report(document,output_size):
+  '''
+  bytes per category and bytes saved
+    content: page content, form xobjects and other streams, saved by stream compression
+    (streams are attributed by the fpdf output section that wrote them, font cmaps count as fonts)
+    images: source image files minus embedded image data (downsampling, recompression)
+    fonts: font files minus embedded subsets
+    object_streams: saved by rewriting into object streams
+  '''
+  renderer = document.doc
+  report = {'output_bytes':output_size,'profile':vars(document.output_profile) if document.output_profile else None}
+  image_source_bytes = sum(renderer.image_source_bytes.values())
+
+  if document.renderer_type != 'fpdf':
+    #no pdf parser in the browser -> only the savings known while drawing
+    report['images'] = {'bytes':image_source_bytes - renderer.image_bytes_saved,'saved':renderer.image_bytes_saved}
+    return report
+
+  output = document._get_output()
+  #the object numbers of fpdf's output are kept by object streams, not by appending to an existing pdf
+  stream_labels = renderer.stream_labels if document._base_pdf is None else None
+  try:
+    categories = analyze_pdf(output,stream_labels)
+  except ImportError:
+    report['images'] = {'source_bytes':image_source_bytes}
+    return report
+
+  import os
+  font_files = {getattr(font,'ttffile',None) for font in renderer.fonts.values()}
+  font_bytes = sum(os.path.getsize(path) for path in font_files if path and os.path.exists(str(path)))
+  content = categories['content']
+  report.update({
+    'content':{'bytes':content['bytes'],'saved':content['decoded_bytes'] - content['bytes']},
+    'images':{'bytes':categories['images']['bytes'],'saved':max(0,image_source_bytes - categories['images']['bytes'])},
+    'fonts':{'bytes':categories['fonts']['bytes'],'saved':max(0,font_bytes - categories['fonts']['bytes'])},
+    'structure':{'bytes':output_size - content['bytes'] - categories['images']['bytes'] - categories['fonts']['bytes']},
+    'object_streams':{'saved':renderer.object_stream_bytes_saved},
+  })
+  return report
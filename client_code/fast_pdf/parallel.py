@@ -0,0 +1,198 @@
+"""
+Server side rendering of independent document sections
+  render_parallel: sections render in worker processes and are merged into a single pdf with pypdf (optional dependency)
+  SectionWriter: sections rendered one after the other are written into a stream as soon as they are finished
+                 -> memory depends on the largest section instead of the whole document
+"""
+
+
+def _render_section(page_setup,section,page_offset,count_only):
+  '''renders a single section -> returns its page count or the pdf bytes'''
+  from . import Document
+  doc = Document(**page_setup)
+  doc.set_page_offset(page_offset)
+  section(doc)
+  if count_only:
+    return doc.doc.page
+  return bytes(doc.doc.output())
+
+
+def merge_pdfs(parts):
+  '''merges a list of pdf byte strings into one, identical objects (images, fonts) are only kept once'''
+  import io
+  try:
+    from pypdf import PdfReader, PdfWriter
+  except ImportError:
+    raise ImportError('merging pdf files requires pypdf -> add "pypdf" to your server requirements')
+
+  writer = PdfWriter()
+  for part in parts:
+    writer.append(PdfReader(io.BytesIO(part)))
+  if hasattr(writer,'compress_identical_objects'):
+    writer.compress_identical_objects(remove_identicals=True,remove_orphans=True)
+
+  output = io.BytesIO()
+  writer.write(output)
+  return output.getvalue()
+
+
+class SectionWriter:
+  '''
+  Writes the pages of several pdf files into a binary stream as one pdf, every pdf is written when it is added
+  Objects are renumbered and written as they are, only their offsets and the page numbers are kept until close()
+  Outlines, named destinations and document level settings of the added pdfs are not kept
+  '''
+  #object numbers of the merged pdf
+  PAGES = 1
+  CATALOG = 2
+
+  def __init__(self,stream):
+    self.stream = stream
+    self.position = 0
+    #offsets of the objects 3, 4, ... in the order of their numbers
+    self.offsets = []
+    self.pages = []
+    self.info = None
+    #version in the header (first pdf) and highest version of all pdfs
+    self.header_version = None
+    self.version = None
+
+  def add(self,pdf_bytes):
+    '''writes all pages of pdf_bytes and the objects they use, returns the number of pages'''
+    import io
+    pypdf = _get_pypdf()
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    version = reader.pdf_header[len('%PDF-'):]
+    if self.version is None:
+      self._write(b'%PDF-' + version.encode() + b'\n%\xe2\xe3\xcf\xd3\n')
+      self.header_version = self.version = version
+    elif _get_version(version) > _get_version(self.version):
+      self.version = version
+
+    trailer = reader.trailer
+    root = trailer.raw_get('/Root').idnum
+    objects = []
+    #object number in pdf_bytes -> object number in the merged pdf
+    numbers = {}
+    for number in range(1,int(trailer['/Size'])):
+      obj = reader.get_object(number)
+      if obj is None or number == root:
+        continue
+      kind = obj.get('/Type') if hasattr(obj,'get') else None
+      if kind == '/Pages':
+        #the pages of all added pdfs have a single parent
+        numbers[number] = self.PAGES
+      elif kind not in ('/XRef','/ObjStm'):
+        numbers[number] = 3 + len(self.offsets) + len(objects)
+        objects.append((number,obj))
+
+    if self.info is None and '/Info' in trailer:
+      self.info = numbers.get(trailer.raw_get('/Info').idnum)
+    pages = {page.indirect_reference.idnum:page for page in reader.pages}
+    for number,obj in objects:
+      if number in pages:
+        obj = _get_page(obj)
+      self.offsets.append(self.position)
+      self._write(b'%d 0 obj\n' % numbers[number] + _serialize(_renumber(obj,numbers)) + b'\nendobj\n')
+    self.pages.extend(numbers[number] for number in pages)
+    return len(pages)
+
+  def close(self):
+    '''writes the page tree, the catalog, the cross-reference table and the trailer'''
+    if self.version is None:
+      raise ValueError('SectionWriter needs at least one pdf before close()')
+    pages_offset = self.position
+    kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+    self._write(b'%d 0 obj\n<</Type /Pages /Kids [%s] /Count %d>>\nendobj\n' % (self.PAGES,kids,len(self.pages)))
+    catalog_offset = self.position
+    #a later pdf with a higher version than the header
+    version = b' /Version /' + self.version.encode() if self.version != self.header_version else b''
+    self._write(b'%d 0 obj\n<</Type /Catalog /Pages %d 0 R%s>>\nendobj\n' % (self.CATALOG,self.PAGES,version))
+
+    xref_offset = self.position
+    size = len(self.offsets) + 3
+    rows = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+    rows.extend(b'%010d 00000 n \n' % offset for offset in [pages_offset,catalog_offset] + self.offsets)
+    self._write(b''.join(rows))
+    info = b' /Info %d 0 R' % self.info if self.info else b''
+    self._write(b'trailer\n<</Size %d /Root %d 0 R%s>>\nstartxref\n%d\n%%%%EOF\n' % (size,self.CATALOG,info,xref_offset))
+
+  def _write(self,data):
+    self.stream.write(data)
+    self.position += len(data)
+
+
+def _get_pypdf():
+  try:
+    import pypdf
+  except ImportError:
+    raise ImportError('merging pdf files requires pypdf -> add "pypdf" to your server requirements')
+  return pypdf
+
+
+def _get_version(version):
+  return tuple(int(part) for part in version.split('.'))
+
+
+#page attributes a page can inherit from its parents in the page tree
+INHERITED_KEYS = ('/Resources','/MediaBox','/CropBox','/Rotate')
+
+
+def _get_page(page):
+  '''returns the page dictionary with the attributes inherited from its original page tree'''
+  from pypdf.generic import DictionaryObject,NameObject
+  page = DictionaryObject(page)
+  parent = page.get('/Parent')
+  while parent is not None:
+    parent = parent.get_object()
+    for key in INHERITED_KEYS:
+      if key not in page and key in parent:
+        page[NameObject(key)] = parent.raw_get(key)
+    parent = parent.get('/Parent')
+  return page
+
+
+def _renumber(obj,numbers):
+  '''returns a copy of obj whose references use the object numbers of the merged pdf'''
+  from pypdf.generic import IndirectObject,DictionaryObject,ArrayObject,StreamObject,NullObject
+  if isinstance(obj,IndirectObject):
+    number = numbers.get(obj.idnum)
+    #references to the catalog of an added pdf
+    return NullObject() if number is None else IndirectObject(number,0,None)
+  if isinstance(obj,StreamObject):
+    copy = type(obj)()
+    copy._data = obj._data
+    copy.update({key:_renumber(value,numbers) for key,value in obj.items()})
+    return copy
+  if isinstance(obj,DictionaryObject):
+    return DictionaryObject({key:_renumber(value,numbers) for key,value in obj.items()})
+  if isinstance(obj,ArrayObject):
+    return ArrayObject(_renumber(value,numbers) for value in obj)
+  return obj
+
+
+def _serialize(obj):
+  import io
+  buffer = io.BytesIO()
+  obj.write_to_stream(buffer)
+  return buffer.getvalue()
+
+
+def render_parallel(page_setup,sections,workers=None,continuous_page_numbers=True):
+  '''renders each section in a worker process and returns the merged pdf bytes'''
+  from concurrent.futures import ProcessPoolExecutor
+  sections = list(sections)
+  if not sections:
+    raise ValueError('render_parallel needs at least one section')
+
+  count = len(sections)
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    offsets = [0] * count
+    #page numbers only show up in headers and footers -> count the pages of each section first
+    if continuous_page_numbers and (page_setup.get('header_function') or page_setup.get('footer_function')):
+      page_counts = list(executor.map(_render_section,[page_setup] * count,sections,offsets,[True] * count))
+      for i in range(1,count):
+        offsets[i] = offsets[i-1] + page_counts[i-1]
+    parts = list(executor.map(_render_section,[page_setup] * count,sections,offsets,[False] * count))
+
+  return merge_pdfs(parts)
@@ -0,0 +1,68 @@
+"""
+Server side reuse of configured documents between jobs e.g. concurrent uplink or server calls
+
+Thread safety:
+  A Document and its renderer belong to one thread at a time, never draw into the same Document from several threads
+  Everything shared between documents is safe to use from several threads at once:
+    fonts.registry and images.registry (locked, fonts are parsed once, images decoded once per process)
+    output profiles with their own compression level (applied per document, no process wide fpdf settings change)
+  fpdf2 releases the GIL in zlib and PIL while compressing streams and encoding images, so threads speed up
+  documents with large content streams and images, pure drawing code runs one thread at a time
+"""
+
+from . import utils
+
+
+class DocumentPool:
+  def __init__(self,page_setup=None,setup=None,max_idle=None):
+    '''
+    Hands out reset documents with the same page setup to the jobs of any thread
+
+    Args:
+      page_setup: Document arguments e.g. Document.get_page_setup()
+      setup: optional callable(document) preparing every document handed out e.g. adding fonts
+             (released documents keep their renderer with the added fonts -> adding them again returns early)
+      max_idle: maximum number of idle documents kept for reuse, unlimited by default
+    '''
+    self.page_setup = page_setup or {}
+    self.setup = setup
+    self.max_idle = max_idle
+    self.idle = []
+    self.lock = utils.create_lock()
+    self.created = 0
+    self.reused = 0
+
+  def acquire(self):
+    '''returns an empty document that belongs to the caller until release()'''
+    with self.lock:
+      document = self.idle.pop() if self.idle else None
+      if document is None:
+        self.created += 1
+      else:
+        self.reused += 1
+    if document is None:
+      from . import Document
+      document = Document(**self.page_setup)
+    if self.setup is not None:
+      self.setup(document)
+    return document
+
+  def release(self,document):
+    '''empties the document in place and keeps it for the next acquire()'''
+    document.reset()
+    with self.lock:
+      if self.max_idle is None or len(self.idle) < self.max_idle:
+        self.idle.append(document)
+
+  def render(self,job,*args):
+    '''runs job(document,*args) on a pooled document and returns the pdf bytes'''
+    document = self.acquire()
+    try:
+      job(document,*args)
+      return bytes(document._get_output())
+    finally:
+      self.release(document)
+
+  def get_stats(self):
+    '''returns the number of created and reused documents as a dict'''
+    return {'created':self.created,'reused':self.reused,'idle':len(self.idle)}
@@ -0,0 +1,173 @@
+"""
+Opt-in profiling for Document (Document(profile=True))
+Public Document methods, header/footer callbacks and the renderer hot paths are wrapped on the instance
+when profiling is enabled, documents without profiling run the unwrapped methods
+"""
+
+import time
+
+_clock = getattr(time,'perf_counter',time.time)
+
+#Document methods that are not profiled
+EXCLUDED = ('get_profile',)
+
+
+class Timing:
+  def __init__(self):
+    self.calls = 0
+    self.seconds = 0.0
+
+  def to_dict(self):
+    return {'calls':self.calls,'seconds':self.seconds}
+
+
+class Profiler:
+  def __init__(self,document):
+    from . import fonts, images
+    self.document = document
+    #method name -> Timing, cumulative (nested calls are included in the caller)
+    self.methods = {}
+    #header, footer, measure (uncached text widths), output
+    self.phases = {}
+    #time spent in Document methods excluding nested calls
+    self.total_seconds = 0.0
+    self.depth = 0
+    self.bridge_calls = 0
+    self.output_bytes = None
+    #the registries are shared -> report the difference to the state when profiling started
+    self.image_stats = images.registry.get_stats()
+    self.font_stats = fonts.registry.get_stats()
+
+  def get_timing(self,group,name):
+    timing = group.get(name)
+    if timing is None:
+      timing = group[name] = Timing()
+    return timing
+
+  def wrap(self,function,timing,on_call=None):
+    '''returns function measuring its calls into timing, on_call(result) is called after every call'''
+    def timed(*args,**kwargs):
+      start = _clock()
+      try:
+        result = function(*args,**kwargs)
+      finally:
+        timing.calls += 1
+        timing.seconds += _clock() - start
+      if on_call:
+        on_call(result)
+      return result
+    return timed
+
+  def wrap_method(self,function,timing):
+    '''like wrap, additionally sums up the time of calls that are not nested in other Document methods'''
+    def timed(*args,**kwargs):
+      self.depth += 1
+      start = _clock()
+      try:
+        return function(*args,**kwargs)
+      finally:
+        seconds = _clock() - start
+        self.depth -= 1
+        timing.calls += 1
+        timing.seconds += seconds
+        if not self.depth:
+          self.total_seconds += seconds
+    return timed
+
+  def attach(self):
+    document = self.document
+    for name in dir(type(document)):
+      if name.startswith('_') or name in EXCLUDED or not callable(getattr(type(document),name)):
+        continue
+      setattr(document,name,self.wrap_method(getattr(document,name),self.get_timing(self.methods,name)))
+
+    renderer = document.doc
+    for name in ('header_callback','footer_callback'):
+      callback = getattr(renderer,name,None)
+      if callback is not None:
+        setattr(renderer,name,self.wrap(callback,self.get_timing(self.phases,name.split('_')[0])))
+    renderer._get_unit_width = self.wrap(renderer._get_unit_width,self.get_timing(self.phases,'measure'),self._count_bridge_call)
+    #the measurer holds the bound method
+    renderer.measurer.unit_width_function = renderer._get_unit_width
+
+    if document.renderer_type == 'jspdf':
+      self._attach_jspdf(renderer)
+    else:
+      renderer.output = self.wrap(renderer.output,self.get_timing(self.phases,'output'),self._set_output_bytes)
+
+  def _attach_jspdf(self,renderer):
+    from .jspdf import MEASUREMENT_OPS
+    call = renderer._call
+    def counted_call(method,*args):
+      #worker mode only records, measurement operations also go to the page's jspdf
+      if renderer.ops is None and (renderer.worker_ops is None or method in MEASUREMENT_OPS):
+        self.bridge_calls += 1
+      call(method,*args)
+    renderer._call = counted_call
+
+    call_many = renderer._call_many
+    def counted_call_many(ops):
+      #recorded static blocks go through _call one by one
+      if renderer.ops is None and renderer.worker_ops is None and not renderer.recording_static:
+        self.bridge_calls += 1
+      call_many(ops)
+    renderer._call_many = counted_call_many
+
+    flush = renderer.flush
+    def counted_flush():
+      if renderer.ops:
+        self.bridge_calls += 1
+      flush()
+    renderer.flush = counted_flush
+
+    get_text_width = renderer._get_text_width
+    def counted_get_text_width(text):
+      if renderer.current_font is None:
+        self.bridge_calls += 1
+      return get_text_width(text)
+    renderer._get_text_width = counted_get_text_width
+
+    self.document.to_blob = self.wrap(self.document.to_blob,self.get_timing(self.phases,'output'),self._set_media_bytes)
+
+  def _count_bridge_call(self,result):
+    if self.document.renderer_type == 'jspdf':
+      self.bridge_calls += 1
+
+  def _set_output_bytes(self,result):
+    self.output_bytes = len(result)
+
+  def _set_media_bytes(self,media):
+    self.bridge_calls += 1
+    self.output_bytes = getattr(media,'length',None)
+
+  def get_report(self):
+    '''returns the collected data as a dict'''
+    from . import fonts, images
+    document = self.document
+    renderer = document.doc
+    pages = renderer.page_no() - renderer.page_offset
+    methods = {name:timing.to_dict() for name,timing in self.methods.items() if timing.calls}
+    is_jspdf = document.renderer_type == 'jspdf'
+    return {
+      'renderer':document.renderer_type,
+      'pages':pages,
+      'total_seconds':self.total_seconds,
+      'methods':dict(sorted(methods.items(),key=lambda item:-item[1]['seconds'])),
+      'phases':{name:timing.to_dict() for name,timing in self.phases.items()},
+      'output_bytes':self.output_bytes,
+      'bytes_per_page':self.output_bytes / pages if self.output_bytes and pages else None,
+      'bridge_calls':self.bridge_calls if is_jspdf else None,
+      'bridge_calls_saved':renderer.bridge_calls_saved if is_jspdf else 0,
+      'text_widths':_get_hit_rate(renderer.measurer.hits,renderer.measurer.misses),
+      'images':_get_hit_rate(*_get_difference(self.image_stats,images.registry.get_stats())),
+      'fonts':_get_hit_rate(*_get_difference(self.font_stats,fonts.registry.get_stats())),
+    }
+
+
+def _get_difference(start,end):
+  return end['hits'] - start['hits'],end['misses'] - start['misses']
+
+
+def _get_hit_rate(hits,misses):
+  lookups = hits + misses
+  return {'hits':hits,'misses':misses,'hit_rate':hits / lookups if lookups else None}
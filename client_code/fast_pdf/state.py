@@ -0,0 +1,28 @@
+"""
+Graphics state last sent to a renderer backend (jspdf or fpdf2)
+Both renderers compare state changes against it and skip the ones that would set the current value again
+None means unknown -> the next change is always sent e.g. after recording or replaying static blocks
+"""
+
+
+class GraphicsState:
+  __slots__ = ('font_name','font_style','font_size','font_object','text_color','draw_color','fill_color','line_width')
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    '''forgets the whole state, every following change reaches the backend'''
+    self.font_name = None
+    self.font_style = None
+    self.font_size = None
+    #fpdf: font object selected by the last change -> changes made without the renderer methods are detected
+    self.font_object = None
+    self.text_color = None
+    self.reset_page()
+
+  def reset_page(self):
+    '''forgets the parts of the state that are stored in the content stream of a page'''
+    self.draw_color = None
+    self.fill_color = None
+    self.line_width = None
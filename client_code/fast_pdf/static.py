@@ -0,0 +1,125 @@
+"""
+Static blocks: content that is identical on every page (logos, rules, fixed header texts) is drawn once per
+document and reused on every page without calling the drawing function again
+  Server: the recorded content becomes a pdf Form XObject, every page only references it with "/In Do"
+  Client: the recorded jspdf operations are replayed with a single bridge call
+          (jspdf form objects are only available in its advanced api mode with a different coordinate system)
+Parts that change from page to page (page numbers) are drawn by the dynamic function on top of the static content
+"""
+
+
+class StaticBlock:
+  def __init__(self,draw,dynamic=None):
+    '''
+    Can be used as header_function/footer_function of a Document
+    draw: callable(pdf) drawing the static content, called once per document
+    dynamic: optional callable(pdf) drawing the parts that change on every page
+    '''
+    self.draw = draw
+    self.dynamic = dynamic
+
+  def __call__(self,pdf):
+    pdf.draw_static(self.draw)
+    if self.dynamic is not None:
+      self.dynamic(pdf)
+
+
+class StaticForm:
+  def __init__(self,index,x,y):
+    #fpdf xobject index -> referenced as /I<index>
+    self.index = index
+    #cursor position after drawing the block
+    self.x = x
+    self.y = y
+
+
+class _FormResources:
+  '''resource dictionary of a form xobject, used by fpdf's output like the ones of its blend groups'''
+  def __init__(self,resources):
+    #set of (PDFResourceType,name) found in the content stream
+    self.resources = resources
+
+  def get_resource_dictionary(self,gfxstate_objs_per_name,pattern_objs_per_name,shading_objs_per_name,font_objs_per_index,img_objs_per_index):
+    from fpdf.enums import PDFResourceType
+    names = {}
+    for resource_type,name in self.resources:
+      names.setdefault(resource_type,set()).add(str(name))
+
+    parts = []
+    groups = [
+      ('ExtGState',PDFResourceType.EXT_G_STATE,gfxstate_objs_per_name,lambda name: name),
+      ('Pattern',PDFResourceType.PATTERN,pattern_objs_per_name,lambda name: name),
+      ('Font',PDFResourceType.FONT,font_objs_per_index,int),
+      ('XObject',PDFResourceType.X_OBJECT,img_objs_per_index,int),
+    ]
+    prefixes = {'Font':'F','XObject':'I'}
+    for key,resource_type,objects,get_key in groups:
+      entries = ''.join(f'/{prefixes.get(key,"")}{name} {objects[get_key(name)].id} 0 R' for name in sorted(names.get(resource_type,())) if get_key(name) in objects)
+      if entries:
+        parts.append(f'/{key}<<{entries}>>')
+    return '<<' + ''.join(parts) + '>>'
+
+
+#fpdf2 versions whose private form xobject internals record_fpdf_form is written against
+FORM_FPDF_VERSIONS = ('2.8.9',)
+
+#fpdf attributes restored after recording a static block
+FPDF_STATE = ('x','y','font_family','font_style','font_size_pt','font_size','current_font','draw_color','fill_color','text_color','line_width','underline')
+
+
+def get_form_support(pdf):
+  '''returns None if static blocks of pdf can become form xobjects, otherwise the reason why they are drawn on every page'''
+  import fpdf
+  if fpdf.__version__ not in FORM_FPDF_VERSIONS:
+    return f"fpdf2 {fpdf.__version__} is not supported for form xobjects (supported: {', '.join(FORM_FPDF_VERSIONS)})"
+  if not hasattr(getattr(pdf,'_resource_catalog',None),'form_xobjects'):
+    return 'fpdf2 has no form xobject catalog'
+  if not pdf.page or not isinstance(pdf.pages[pdf.page].contents,bytearray):
+    return 'static block drawn outside of a page'
+  return None
+
+
+#reasons already printed -> one warning per process
+_warned = set()
+
+
+def record_fpdf_form(pdf,draw):
+  '''
+  draws draw(pdf) into a new form xobject of pdf and returns a StaticForm
+  returns None if get_form_support() gives a reason against it -> the block is drawn again on every call
+  '''
+  reason = get_form_support(pdf)
+  if reason is not None:
+    if reason not in _warned:
+      _warned.add(reason)
+      print(f'WARNING: fast_pdf static blocks are drawn again on every page: {reason}')
+    return None
+  catalog = pdf._resource_catalog
+  contents = pdf.pages[pdf.page].contents
+  from fpdf.syntax import Name, PDFArray, PDFContentStream
+
+  state = {name:getattr(pdf,name) for name in FPDF_STATE if hasattr(pdf,name)}
+  start = len(contents)
+  #the form must set its own font and colors
+  pdf.current_font_is_set_on_page = False
+  pdf.sent_state.reset()
+  draw(pdf)
+  stream = bytes(contents[start:])
+  del contents[start:]
+  form = StaticForm(catalog.next_xobject_index,pdf.x,pdf.y)
+  for name,value in state.items():
+    setattr(pdf,name,value)
+  pdf.current_font_is_set_on_page = False
+  pdf.sent_state.reset()
+
+  #with an output profile level the form is compressed at output like the pages
+  xobject = PDFContentStream(contents=stream,compress=pdf.compress and pdf.compression_level is None)
+  xobject.type = Name('XObject')
+  xobject.subtype = Name('Form')
+  xobject.b_box = PDFArray([0,0,round(pdf.w_pt,2),round(pdf.h_pt,2)])
+  #fpdf fills the resources of form xobjects that have a _blend_group
+  xobject._blend_group = _FormResources(catalog.scan_stream(stream.decode('latin-1')))
+  xobject._registered = False
+  catalog.next_xobject_index += 1
+  catalog.form_xobjects.append((form.index,xobject))
+  return form
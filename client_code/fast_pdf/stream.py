@@ -0,0 +1,73 @@
+"""
+Page range streaming of recorded jspdf documents -> Document.stream_pages()
+The operations recorded for the web worker are cut at every chunk_pages-th addPage into jobs that render on
+their own, each job starts with the fonts and the graphics state of the operations before it
+Pure python, the jobs have the format of jsPdf.get_worker_job() and can be rendered by headless.render_in_worker
+"""
+
+#operations that set fonts -> part of every job
+FONT_OPS = ('addFileToVFS','addFont')
+#operations that set the graphics state -> the last one of each method is replayed at the start of the next job
+STATE_OPS = ('setFont','setFontSize','setTextColor','setDrawColor','setFillColor','setLineWidth')
+
+
+class PageChunker:
+  def __init__(self,on_job,chunk_pages=10,orientation='portrait',page_format=None):
+    '''
+    on_job: callable(job) receiving every finished page range, job['first_page'] is the first page of the range
+    orientation,page_format: size of the first page, later pages take theirs from addPage
+    '''
+    if chunk_pages < 1:
+      raise ValueError(f'chunk_pages must be at least 1, got {chunk_pages}')
+    self.on_job = on_job
+    self.chunk_pages = chunk_pages
+    self.orientation = orientation
+    self.page_format = page_format
+    self.font_ops = []
+    #method -> last operation of STATE_OPS
+    self.state = {}
+    self.first_page = 1
+    #jspdf documents start with one page
+    self.pages = 1
+    self.ops = []
+    #number of recorded operations processed by feed()
+    self.offset = 0
+
+  def feed(self,ops):
+    '''processes the operations appended to ops since the last call, finished page ranges are sent to on_job'''
+    for index in range(self.offset,len(ops)):
+      op = ops[index]
+      method = op[0]
+      if method == 'addPage':
+        if self.pages == self.chunk_pages:
+          self._send()
+          #the page size of the new job
+          self.page_format = op[1]
+          self.orientation = op[2]
+          continue
+        self.pages += 1
+      elif method in FONT_OPS:
+        self.font_ops.append(op)
+      elif method in STATE_OPS:
+        self.state[method] = op
+      self.ops.append(op)
+    self.offset = len(ops)
+
+  def finish(self,ops):
+    '''processes the remaining operations and sends the last page range'''
+    self.feed(ops)
+    self._send()
+
+  def _send(self):
+    job = {
+      'orientation':self.orientation,
+      'format':self.page_format,
+      'pages':self.pages,
+      'first_page':self.first_page,
+      'ops':self.ops,
+    }
+    self.first_page += self.pages
+    self.pages = 1
+    #the next job starts with the fonts and the state at the end of this one
+    self.ops = self.font_ops + [self.state[method] for method in STATE_OPS if method in self.state]
+    self.on_job(job)
@@ -0,0 +1,125 @@
+"""
+Table drawing for both renderers
+The column layout is computed once per table, afterwards rows are only wrapped and drawn
+"""
+
+from itertools import chain, islice
+
+from .wrap import wrap_text
+
+
+class Column:
+  def __init__(self,title='',width=None,align='L'):
+    '''width=None -> the column shares the remaining page width with the other automatic columns'''
+    self.title = title
+    self.width = width
+    self.align = align
+
+
+def get_columns(columns):
+  '''accepts Column objects, dicts with Column arguments or plain titles'''
+  result = []
+  for column in columns:
+    if isinstance(column,Column):
+      result.append(column)
+    elif isinstance(column,dict):
+      result.append(Column(**column))
+    else:
+      result.append(Column(str(column)))
+  return result
+
+
+def get_widths(document,columns,sample_rows,padding=2):
+  '''fixed widths are kept, automatic widths split the remaining page width by the widest sampled text'''
+  get_width = document.get_string_width
+  available = document.page_width - document.margin_left - document.margin_right
+  available -= sum(column.width for column in columns if column.width is not None)
+
+  natural = []
+  for index,column in enumerate(columns):
+    if column.width is not None:
+      natural.append(0)
+      continue
+    texts = [column.title] + [_to_text(row[index]) for row in sample_rows if index < len(row)]
+    natural.append(max(get_width(text) for text in texts) + padding)
+
+  total = sum(natural)
+  widths = []
+  for column,width in zip(columns,natural):
+    if column.width is not None:
+      widths.append(column.width)
+    else:
+      widths.append(available * width / total if total else 0)
+  return widths
+
+
+def _to_text(value):
+  return '' if value is None else str(value)
+
+
+def draw_table(document,columns,rows,line_height=6,border=0,header=True,header_fill=False,sample_size=50,padding=2):
+  columns = get_columns(columns)
+  rows = iter(rows)
+
+  #only automatic widths need a look at the data
+  sample_rows = []
+  if any(column.width is None for column in columns):
+    sample_rows = list(islice(rows,sample_size))
+    rows = chain(sample_rows,rows)
+
+  widths = get_widths(document,columns,sample_rows,padding)
+  aligns = [column.align for column in columns]
+  wrap_widths = [width - padding for width in widths]
+  titles = [column.title for column in columns]
+
+  renderer = document.doc
+  rect_style = 'D' if border else ''
+  get_width = document.get_string_width
+  is_jspdf = document.renderer_type == 'jspdf'
+  if is_jspdf:
+    #record the drawing of each page and replay it into jspdf at once
+    batching = renderer.ops is None
+    if batching:
+      renderer.ops = []
+    draw_cell = lambda w,h,text,align: renderer.cell(w,h,text,ln=0,align=align,check_new_page=False)
+  else:
+    renderer.set_auto_page_break(True,margin=document.margin_bottom+document.footer_height)
+    draw_cell = lambda w,h,text,align: renderer.cell(w,h,text,align=align)
+
+  def draw_row(texts,fill):
+    cells = []
+    for text,width in zip(texts,wrap_widths):
+      if '\n' in text or get_width(text) > width:
+        cells.append(wrap_text(text,width,get_width))
+      else:
+        cells.append((text,))
+    row_height = max(len(lines) for lines in cells) * line_height
+
+    if document.will_page_break(row_height):
+      document.add_page(orientation=document.orientation)
+      if header:
+        draw_row(titles,header_fill)
+
+    x = start_x = document.get_x()
+    y = document.get_y()
+    for lines,width,align in zip(cells,widths,aligns):
+      #border and background cover the full row height
+      if rect_style or fill:
+        renderer.rect(x,y,width,row_height,'DF' if rect_style and fill else rect_style or 'F')
+      height = line_height if len(lines) > 1 else row_height
+      for number,line in enumerate(lines):
+        if line:
+          renderer.set_xy(x,y + number * line_height)
+          draw_cell(width,height,line,align)
+      x += width
+    renderer.set_xy(start_x,y + row_height)
+
+  try:
+    if header:
+      draw_row(titles,header_fill)
+    for row in rows:
+      draw_row([_to_text(value) for value in row],False)
+  finally:
+    if is_jspdf and batching:
+      renderer.flush()
+      renderer.ops = None
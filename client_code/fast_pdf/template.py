@@ -0,0 +1,250 @@
+"""
+Compiled document templates for mail merge style documents
+A script is recorded once with Slot placeholders instead of dynamic texts, rendering a record only fills the slots
+
+Server: the static content is rendered once, every record starts from a copy of that rendered state
+        and only draws the slot texts at their recorded positions
+Client: the recorded calls are replayed without running the script again
+Slots are supported as the text of Document.cell and do not reflow the following content
+"""
+
+
+class Slot:
+  def __init__(self,name,format=None,parts=None):
+    '''format: optional callable to convert the record value into text'''
+    self.name = name
+    self.format = format
+    #concatenations with static strings -> list of strings and slots
+    self.parts = parts or [self]
+
+  def render(self,data):
+    texts = []
+    for part in self.parts:
+      if isinstance(part,str):
+        texts.append(part)
+      else:
+        value = data[part.name]
+        texts.append(part.format(value) if part.format else ('' if value is None else str(value)))
+    return ''.join(texts)
+
+  def __add__(self,other):
+    return Slot(self.name,parts=self.parts + _get_parts(self,other))
+
+  def __radd__(self,other):
+    return Slot(self.name,parts=_get_parts(self,other) + self.parts)
+
+  #the value is only known per record -> converting a slot while compiling would bake a wrong text into the template
+  def __str__(self):
+    raise TypeError(_get_usage_error(self,'str()'))
+
+  def __format__(self,format_spec):
+    raise TypeError(_get_usage_error(self,'formatting'))
+
+
+def _get_parts(slot,value):
+  if isinstance(value,Slot):
+    return value.parts
+  if not isinstance(value,str):
+    raise TypeError(_get_usage_error(slot,f'+ with {type(value).__name__}'))
+  return [value]
+
+
+def _get_usage_error(slot,operation):
+  return (f"Slot '{slot.name}' does not support {operation} while compiling a template, "
+          f"use data['{slot.name}'] (optionally + strings) directly as text of cell() "
+          f"and convert values with Slot(name,format=callable)")
+
+
+class SlotData:
+  '''passed to the script while compiling -> every lookup returns a Slot'''
+  def __getitem__(self,name):
+    return Slot(name)
+
+  def get(self,name,default=None):
+    return Slot(name)
+
+
+def _render_value(value,data):
+  return value.render(data) if isinstance(value,Slot) else value
+
+
+class SlotCell:
+  '''a cell whose text is filled per record, position and text state are taken from the static render'''
+  def __init__(self,slot,width,height,align,page,x,y,font,text_color):
+    self.slot = slot
+    self.width = width
+    self.height = height
+    self.align = align
+    self.page = page
+    self.x = x
+    self.y = y
+    self.font = font
+    self.text_color = text_color
+
+
+class _Recorder:
+  '''wraps a Document, records every public call and renders slot cells empty'''
+  def __init__(self,document):
+    self._document = document
+    self.ops = []
+    self.slot_cells = []
+
+  def __getattr__(self,name):
+    attribute = getattr(self._document,name)
+    if name.startswith('_') or not callable(attribute):
+      return attribute
+
+    def record(*args,**kwargs):
+      self.ops.append((name,args,kwargs))
+      has_slot = any(isinstance(value,Slot) for value in list(args) + list(kwargs.values()))
+      if not has_slot:
+        return attribute(*args,**kwargs)
+      if name != 'cell':
+        raise ValueError(f"Slots are only supported as text of cell() not in {name}()")
+      return self._record_slot_cell(*args,**kwargs)
+    return record
+
+  def _record_slot_cell(self,width,height,text,border=0,ln=0,align='L',fill=False,check_new_page=True):
+    document = self._document
+    #border and fill are static -> the cell is drawn without text, fpdf keeps x across page breaks
+    x = document.get_x()
+    document.cell(width,height,'',border=border,ln=ln,align=align,fill=fill,check_new_page=check_new_page)
+    if document.renderer_type == 'fpdf':
+      renderer = document.doc
+      y = renderer.get_y() - height if ln else renderer.get_y()
+      font = (renderer.font_family,renderer.font_style,renderer.font_size_pt)
+      self.slot_cells.append(SlotCell(text,width,height,align,renderer.page,x,y,font,renderer.text_color))
+
+
+#name mangled attribute of fpdf's GraphicsStateMixin
+FPDF_STATE_STACK = '_GraphicsStateMixin__statestack'
+
+
+class Template:
+  def __init__(self,page_setup,ops,slot_cells,base=None):
+    self.page_setup = page_setup
+    #recorded Document calls -> (method name,args,kwargs)
+    self.ops = ops
+    self.slot_cells = slot_cells
+    #server: rendered static content
+    self.base = base
+
+  def render_bytes(self,data):
+    '''returns the pdf for a single record as bytes (server) or a media object (client)'''
+    if self.base is None:
+      return self._replay(data).to_blob()
+    return bytes(self._fill_base(data).output())
+
+  def render(self,data,file_name='file'):
+    '''returns the pdf for a single record as anvil media'''
+    if self.base is None:
+      return self._replay(data).to_blob(file_name)
+    import anvil
+    return anvil.BlobMedia("application/pdf",bytes(self._fill_base(data).output()),name=f"{file_name}.pdf")
+
+  def render_many(self,records,file_name='file'):
+    '''generator of rendered media objects, one per record'''
+    for data in records:
+      yield self.render(data,file_name)
+
+  def _replay(self,data):
+    from . import Document
+    document = Document(**self.page_setup)
+    for name,args,kwargs in self.ops:
+      args = [_render_value(value,data) for value in args]
+      kwargs = {key:_render_value(value,data) for key,value in kwargs.items()}
+      getattr(document,name)(*args,**kwargs)
+    return document
+
+  def _copy_base(self):
+    '''copies what filling the slots and output() modify, everything else is shared with the base'''
+    import copy
+    from . import fonts
+    from . import state
+    base = self.base
+    pdf = copy.copy(base)
+    #fpdf keeps font, colors and text style on a graphics state stack
+    setattr(pdf,FPDF_STATE_STACK,[graphics_state.copy() for graphics_state in getattr(base,FPDF_STATE_STACK)])
+    pdf.pages = {}
+    for number,page in base.pages.items():
+      page = pdf.pages[number] = copy.copy(page)
+      page.contents = bytearray(page.contents)
+      page.annots = copy.copy(page.annots)
+    #subset state of the fonts, resources used per page and image object ids are extended by each record
+    #(fpdf keeps the fonts in the resource catalog)
+    memo = {id(font):fonts.copy_font(font) for font in base.fonts.values()}
+    pdf._resource_catalog = copy.deepcopy(base._resource_catalog,memo)
+    pdf.current_font = memo.get(id(base.current_font),base.current_font)
+    pdf.image_cache = copy.copy(base.image_cache)
+    pdf.image_cache.images = {name:copy.copy(info) for name,info in base.image_cache.images.items()}
+    pdf.sent_state = state.GraphicsState()
+    pdf.buffer = bytearray()
+    return pdf
+
+  def _fill_base(self,data):
+    if hasattr(self.base,FPDF_STATE_STACK):
+      pdf = self._copy_base()
+    else:
+      #unknown fpdf2 structure -> copy the whole document
+      import copy
+      from . import fonts
+      pdf = copy.deepcopy(self.base,{id(font):fonts.copy_font(font) for font in self.base.fonts.values()})
+
+    last_page = pdf.page
+    end_font = (pdf.font_family,pdf.font_style,pdf.font_size_pt)
+    end_text_color = pdf.text_color
+    pdf.set_auto_page_break(False)
+    for cell in self.slot_cells:
+      #isolate the slot and establish the graphics state explicitly, the page content may end in any state
+      pdf.page = cell.page
+      pdf._out('q')
+      pdf._out(pdf.fill_color.serialize().lower())
+      pdf.set_font(*cell.font)
+      pdf.current_font_is_set_on_page = False
+      pdf.text_color = cell.text_color
+      pdf.set_xy(cell.x,cell.y)
+      pdf.cell(cell.width,cell.height,cell.slot.render(data),align=cell.align)
+      pdf._out('Q')
+
+    pdf.page = last_page
+    pdf.set_font(*end_font)
+    pdf.current_font_is_set_on_page = False
+    pdf.text_color = end_text_color
+    pdf.set_auto_page_break(self.base.auto_page_break,margin=self.base.b_margin)
+    return pdf
+
+  def benchmark(self,script,records):
+    '''compares rendering records through this template with running script for every record'''
+    import time
+    from . import Document
+    records = list(records)
+    start = time.time()
+    for data in records:
+      self.render_bytes(data)
+    template_seconds = time.time() - start
+
+    start = time.time()
+    for data in records:
+      document = Document(**self.page_setup)
+      script(document,data)
+      document.to_blob()
+    script_seconds = time.time() - start
+    return {
+      'records':len(records),
+      'template_seconds':template_seconds,
+      'script_seconds':script_seconds,
+      'speedup':script_seconds / template_seconds if template_seconds else None,
+    }
+
+
+def compile_template(script,**page_setup):
+  '''
+  Records script(document,data) once with slots as data and returns a Template
+  Use data['name'] (optionally concatenated with strings) as text of Document.cell for dynamic texts
+  '''
+  from . import Document
+  document = Document(**page_setup)
+  recorder = _Recorder(document)
+  script(recorder,SlotData())
+  base = document.doc if document.renderer_type == 'fpdf' else None
+  return Template(document.get_page_setup(),recorder.ops,recorder.slot_cells,base)
@@ -13,9 +13,14 @@ def print_pdf(blob_media,new_tab=False):
     import anvil.media
     anvil.media.print_media(blob_media)
   else:
-    import anvil.js
+    import anvil.media
     from anvil.js.window import printJS
-    printJS({'printable':media_obj_to_base64(blob_media), 'type': 'pdf', 'base64': True,'onPrintDialogClose':onClose})  
+    #printJS loads the pdf from an object url -> no base64 copy of the document
+    temp_url = anvil.media.TempUrl(blob_media)
+    def on_close():
+      temp_url.revoke()
+      onClose()
+    printJS({'printable':temp_url.url, 'type': 'pdf','onPrintDialogClose':on_close})
 
 def onClose():
   try:
@@ -52,4 +57,40 @@ def get_image_dimenstions(blob_media)->tuple:
     pil_image = Image.open(bytes_io)
     return pil_image.size
   else:
-    return anvil.image.get_dimensions(blob_media)
\ No newline at end of file
+    return anvil.image.get_dimensions(blob_media)
+
+
+class _NoLock:
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*args):
+    return False
+
+
+def get_values(values,count=None):
+  '''returns a list of python values from a sequence or numpy array, a single number is repeated count times'''
+  if hasattr(values,'tolist'):
+    values = values.tolist()
+  if isinstance(values,(int,float)):
+    return [values] * count
+  return values if isinstance(values,list) else list(values)
+
+
+def get_rows(values,size):
+  '''returns rows of size values from rows, a flat sequence or a numpy array'''
+  values = get_values(values)
+  if values and isinstance(values[0],(list,tuple)):
+    return values
+  if len(values) % size:
+    raise ValueError(f'expected rows of {size} values or a flat sequence of a multiple of {size} values, got {len(values)} values')
+  return [values[index:index + size] for index in range(0,len(values),size)]
+
+
+def create_lock():
+  '''returns a reentrant lock for caches shared between threads (server), a no-op where there is no threading (client)'''
+  try:
+    import threading
+  except ImportError:
+    return _NoLock()
+  return threading.RLock()
@@ -0,0 +1,233 @@
+"""
+Line breaking shared by multi_cell, tables and layout paragraphs of both renderers
+The text is split into items (words or word parts at hyphenation points) whose widths are measured once,
+lines are then broken on plain width arrays either greedy or with Knuth-Plass (minimum raggedness)
+
+Hyphenation:
+  soft hyphens (\\u00ad) in the text are always used as hyphenation points
+  hyphenate=Hyphenator(patterns) or any callable(word) -> list of split positions adds automatic ones
+"""
+
+SOFT_HYPHEN = '\u00ad'
+
+#item joiners -> what separates an item from the next one
+SPACE = ' '
+HYPHEN = '-'
+CUT = ''
+
+#Knuth-Plass: extra cost of a hyphenated line relative to the squared line width
+HYPHEN_PENALTY = 0.01
+
+
+class Hyphenator:
+  def __init__(self,patterns,exceptions=(),left_min=2,right_min=3):
+    '''
+    Liang hyphenation (as used by TeX)
+    patterns: iterable or whitespace separated string of patterns e.g. "hy3ph he2n hena4" (TeX hyph-*.tex files)
+    exceptions: words with hyphens marking the split positions e.g. "ta-ble"
+    left_min,right_min: minimum number of characters before the first and after the last split
+    '''
+    if isinstance(patterns,str):
+      patterns = patterns.split()
+    if isinstance(exceptions,str):
+      exceptions = exceptions.split()
+    self.left_min = left_min
+    self.right_min = right_min
+    #letters -> priorities between letters
+    self.patterns = {}
+    for pattern in patterns:
+      letters = ''.join(char for char in pattern if not char.isdigit())
+      priorities = [0] * (len(letters) + 1)
+      index = 0
+      for char in pattern:
+        if char.isdigit():
+          priorities[index] = int(char)
+        else:
+          index += 1
+      self.patterns[letters] = priorities
+    self.exceptions = {}
+    for word in exceptions:
+      positions,index = [],0
+      for char in word:
+        if char == '-':
+          positions.append(index)
+        else:
+          index += 1
+      self.exceptions[word.replace('-','').lower()] = positions
+    self._cache = {}
+
+  def __call__(self,word):
+    '''returns the positions in word where it may be split'''
+    positions = self._cache.get(word)
+    if positions is None:
+      positions = self._cache[word] = self._get_positions(word)
+    return positions
+
+  def _get_positions(self,word):
+    lower = word.lower()
+    if lower in self.exceptions:
+      return self.exceptions[lower]
+    if len(word) < self.left_min + self.right_min or not word.isalpha():
+      return []
+    text = '.' + lower + '.'
+    priorities = [0] * (len(text) + 1)
+    patterns = self.patterns
+    for start in range(len(text)):
+      for end in range(start + 1,len(text) + 1):
+        pattern = patterns.get(text[start:end])
+        if pattern:
+          for index,priority in enumerate(pattern):
+            if priority > priorities[start + index]:
+              priorities[start + index] = priority
+    #priorities are shifted by the leading dot
+    return [index for index in range(self.left_min,len(word) - self.right_min + 1) if priorities[index + 1] % 2]
+
+
+def fit_text(text,width,get_width):
+  '''returns the number of leading characters of text that fit into width (at least 1)'''
+  low,high = 1,len(text)
+  while low < high:
+    middle = (low + high + 1) // 2
+    if get_width(text[:middle]) <= width:
+      low = middle
+    else:
+      high = middle - 1
+  return low
+
+
+def _split_word(word,hyphenate):
+  '''returns the parts of word at its hyphenation points'''
+  if SOFT_HYPHEN in word:
+    return word.split(SOFT_HYPHEN)
+  if hyphenate is None:
+    return None
+  positions = hyphenate(word)
+  if not positions:
+    return None
+  parts = []
+  start = 0
+  for position in positions:
+    parts.append(word[start:position])
+    start = position
+  parts.append(word[start:])
+  return parts
+
+
+def _get_items(paragraph,width,get_width,hyphenate,widths):
+  '''returns the texts, widths and joiners of the items of a paragraph'''
+  texts,item_widths,joiners = [],[],[]
+
+  def add(text,joiner):
+    item_width = widths.get(text)
+    if item_width is None:
+      item_width = widths[text] = get_width(text)
+    #items wider than the line are cut where they still fit
+    while item_width > width and len(text) > 1:
+      cut = fit_text(text,width,get_width)
+      texts.append(text[:cut])
+      item_widths.append(get_width(text[:cut]))
+      joiners.append(CUT)
+      text = text[cut:]
+      item_width = widths.get(text)
+      if item_width is None:
+        item_width = widths[text] = get_width(text)
+    texts.append(text)
+    item_widths.append(item_width)
+    joiners.append(joiner)
+
+  for word in paragraph.split(' '):
+    parts = _split_word(word,hyphenate) if word else None
+    if parts:
+      for part in parts[:-1]:
+        add(part,HYPHEN)
+      word = parts[-1]
+    add(word,SPACE)
+  return texts,item_widths,joiners
+
+
+def _get_line_width(prefix,gaps,joiners,start,end,hyphen_width):
+  '''width of the items start..end (inclusive) on one line'''
+  return prefix[end + 1] - prefix[start] - gaps[end] + (hyphen_width if joiners[end] == HYPHEN else 0)
+
+
+def _break_greedy(prefix,gaps,joiners,width,hyphen_width):
+  breaks = []
+  count = len(joiners)
+  start = 0
+  while start < count:
+    end = start
+    while end + 1 < count and _get_line_width(prefix,gaps,joiners,start,end + 1,hyphen_width) <= width:
+      end += 1
+    breaks.append(end)
+    start = end + 1
+  return breaks
+
+
+def _break_knuth_plass(prefix,gaps,joiners,width,hyphen_width):
+  '''minimizes the sum of the squared free space of all lines but the last one'''
+  count = len(joiners)
+  infinity = float('inf')
+  costs = [0] + [infinity] * count
+  previous = [0] * (count + 1)
+  penalty = HYPHEN_PENALTY * width * width
+  for end in range(count):
+    is_last = end == count - 1
+    #the width of the items start..end is inlined for speed -> see _get_line_width
+    line_end = prefix[end + 1] - gaps[end]
+    if joiners[end] == HYPHEN:
+      line_end += hyphen_width
+      extra = penalty
+    else:
+      extra = 0
+    best,best_start = infinity,end
+    for start in range(end,-1,-1):
+      free = width - line_end + prefix[start]
+      if free < 0 and start < end:
+        break
+      cost = costs[start] + (extra + free * free if not is_last else 0)
+      if cost < best:
+        best,best_start = cost,start
+    costs[end + 1] = best
+    previous[end + 1] = best_start
+  breaks = []
+  end = count
+  while end > 0:
+    breaks.append(end - 1)
+    end = previous[end]
+  return breaks[::-1]
+
+
+def wrap_text(text,width,get_width,mode='greedy',hyphenate=None):
+  '''
+  Returns the list of lines of text that fit into width, every newline starts a new paragraph
+  get_width: callable(text) -> width in the same unit as width, every distinct word is measured once
+  mode: 'greedy' (fill every line) or 'knuth_plass' (balanced line lengths)
+  hyphenate: optional callable(word) -> split positions e.g. a Hyphenator
+  '''
+  break_lines = _break_knuth_plass if mode == 'knuth_plass' else _break_greedy
+  widths = {}
+  space_width = get_width(' ')
+  hyphen_width = get_width(HYPHEN)
+  lines = []
+  for paragraph in text.split('\n'):
+    texts,item_widths,joiners = _get_items(paragraph.rstrip('\r'),width,get_width,hyphenate,widths)
+    gaps = [space_width if joiner == SPACE else 0 for joiner in joiners]
+    prefix = [0]
+    total = 0
+    for item_width,gap in zip(item_widths,gaps):
+      total += item_width + gap
+      prefix.append(total)
+
+    start = 0
+    for end in break_lines(prefix,gaps,joiners,width,hyphen_width):
+      parts = []
+      for index in range(start,end):
+        parts.append(texts[index])
+        if joiners[index] == SPACE:
+          parts.append(' ')
+      parts.append(texts[end])
+      if joiners[end] == HYPHEN:
+        parts.append(HYPHEN)
+      lines.append(''.join(parts))
+      start = end + 1
+  return lines